@@ -0,0 +1,65 @@
+"""Request buffer management for a camera that runs for a whole event.
+
+Every capture goes through a request that is explicitly released as soon as its
+data has been copied out, so the camera's small pool of request buffers is
+recycled instead of filling up. This lets the camera run between sessions
+rather than being stopped and restarted after every capture.
+"""
+
+import logging
+import threading
+
+class RequestRecycler:
+    """Capture arrays and metadata from explicitly released camera requests."""
+
+    def __init__(self, camera):
+        """Wrap a camera providing capture_request() (Picamera2 or compatible)."""
+        self.logger = logging.getLogger(__name__)
+        self.camera = camera
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+        self.outstanding = 0  # Requests captured and not yet released
+        self.peak_outstanding = 0
+        self.captures = 0
+
+    def capture(self, streams=("main",), on_request=None):
+        """Capture one request and return ({stream: array}, metadata).
+
+        on_request(request) is called before the request is released, e.g. to
+        copy a stream without make_array.
+        """
+        request = self.camera.capture_request()
+        with self._lock:
+            self.outstanding += 1
+            self.peak_outstanding = max(self.peak_outstanding, self.outstanding)
+            self.captures += 1
+        try:
+            arrays = {name: request.make_array(name) for name in streams}
+            metadata = request.get_metadata()
+            if on_request is not None:
+                on_request(request, metadata)
+        finally:
+            request.release()
+            with self._lock:
+                self.outstanding -= 1
+                self._released.notify_all()
+        return arrays, metadata
+
+    def capture_array(self, name: str = "main"):
+        """Capture an array from a stream and release the request immediately."""
+        arrays, _ = self.capture((name,))
+        return arrays[name]
+
+    def recycle(self, timeout: float = 1.0):
+        """Wait until every request has been returned to the camera.
+
+        Returns True if no request is outstanding.
+        """
+        with self._lock:
+            if not self._released.wait_for(lambda: self.outstanding == 0, timeout):
+                self.logger.warning("%d camera requests still outstanding after %.1f s",
+                                    self.outstanding, timeout)
+                return False
+        self.logger.info("Camera buffers recycled: %d captures, peak %d outstanding requests",
+                         self.captures, self.peak_outstanding)
+        return True
@@ -1,14 +1,61 @@
 """Camera control script for the photobooth."""
 
 import os
+import math
 import time
 import logging
+import threading
+from collections import deque
 
+import numpy as np # type: ignore # pylint: disable=E0401
 from PIL import Image # type: ignore # pylint: disable=E0401
-from picamera2 import Picamera2 # type: ignore # pylint: disable=E0401
-from libcamera import Transform # type: ignore # pylint: disable=E0401
 import piexif # type: ignore # pylint: disable=E0401
 
+from booth_frame_buffer import FrameRingBuffer
+from booth_buffers import RequestRecycler
+from camera_backends import BACKEND_PICAMERA2, create_backend
+
+# Camera strategies
+# switch_mode: preview and stills use separate configurations and the sensor is
+#              reconfigured with switch_mode_and_capture_array for each still.
+# dual_stream: a single still configuration with a full resolution "main" stream
+#              and a "lores" preview stream is configured once, so previews and
+#              stills come from the same running pipeline without a mode switch.
+STRATEGY_SWITCH_MODE = "switch_mode"
+STRATEGY_DUAL_STREAM = "dual_stream"
+STRATEGIES = (STRATEGY_SWITCH_MODE, STRATEGY_DUAL_STREAM)
+
+# Timestamp in the cached EXIF block, replaced by the capture time of each photo
+EXIF_DATETIME_PLACEHOLDER = b"0000:00:00 00:00:00"
+# The location in the EXIF block is only updated once the position moved further,
+# so GPS jitter does not rebuild the block for every photo
+LOCATION_UPDATE_METRES = 50
+
+def yuv420_to_rgb(array, width: int, height: int):
+    """Convert a planar YUV420 (I420) array from the lores stream to an RGB array.
+
+    The array is expected to have the shape (height * 3 / 2, stride) as returned by
+    Picamera2.capture_array("lores").
+    """
+    stride = array.shape[1]
+    y = array[:height, :width].astype(np.int32)
+    chroma = array[height:height + height // 2].reshape(-1)
+    u = chroma[:(height // 2) * (stride // 2)].reshape(height // 2, stride // 2)
+    v = chroma[(height // 2) * (stride // 2):].reshape(height // 2, stride // 2)
+    u = u[:, :width // 2].astype(np.int32) - 128
+    v = v[:, :width // 2].astype(np.int32) - 128
+    # Upsample the chroma planes to the luma size
+    u = u.repeat(2, axis=0).repeat(2, axis=1)[:height, :width]
+    v = v.repeat(2, axis=0).repeat(2, axis=1)[:height, :width]
+
+    # BT.601 conversion in 8-bit fixed point
+    y = y << 8
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[..., 0] = np.clip((y + 359 * v) >> 8, 0, 255)
+    rgb[..., 1] = np.clip((y - 88 * u - 183 * v) >> 8, 0, 255)
+    rgb[..., 2] = np.clip((y + 454 * u) >> 8, 0, 255)
+    return rgb
+
 class BoothCamera:
     """Class to take a photo with the Raspberry Pi camera and save it with EXIF metadata."""
     camera_make: str = "Raspberry Pi"
@@ -21,11 +68,45 @@ class BoothCamera:
     filepath: str = ""
     location_lat: str = ""
     location_long: str = ""
-
-    def __init__(self, screen_width: int = 800, screen_height: int = 480):
-        """Take photo for the photobooth"""
+    gps = None  # GpsdClient providing the location, location_lat/long are used if None
+
+    def __init__(self, screen_width: int = 800, screen_height: int = 480,
+                 strategy: str = STRATEGY_SWITCH_MODE,
+                 pre_capture_depth: int = 0, pre_capture_memory_mb: int = 128,
+                 ready_timeout: float = 2.0, ready_stable_frames: int = 3,
+                 ready_tolerance: float = 0.02, keep_running: bool = False,
+                 backend = None, capture_profiles: dict = None):
+        """Take photo for the photobooth
+
+        backend is the CameraBackend to use, or the name of a backend to create
+        (see camera_backends.create_backend), the Raspberry Pi camera if None.
+        capture_profiles maps profile names (e.g. button names) to photo sizes,
+        their configurations are built when the camera starts.
+        """
         self.logger = logging.getLogger(__name__)
 
+        if strategy not in STRATEGIES:
+            self.logger.warning("Unknown camera strategy '%s', using '%s'",
+                                strategy, STRATEGY_SWITCH_MODE)
+            strategy = STRATEGY_SWITCH_MODE
+        self.strategy = strategy
+        self.pre_capture_depth = pre_capture_depth
+        self.pre_capture_memory_mb = pre_capture_memory_mb
+        self.pre_capture = None  # FrameRingBuffer, only with the dual stream strategy
+        # Warm-up: the camera is ready once exposure, gain and colour gains have been
+        # stable for ready_stable_frames frames, or after ready_timeout seconds
+        self.ready_timeout = ready_timeout
+        self.ready_stable_frames = ready_stable_frames
+        self.ready_tolerance = ready_tolerance
+        self.last_warmup_ms = None
+        # EXIF block built once per configuration, see exif_bytes()
+        self._exif_template = None
+        self._exif_template_key = None
+        self._recorded_location = None  # Location in the EXIF block
+        # Keep the camera running between sessions, recycling request buffers
+        self.keep_running = keep_running
+        self.recycler = None
+
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.sensor_width = 2592
@@ -34,21 +115,39 @@ class BoothCamera:
         self.preview_height = 480
         self.preview_position_x = 0
         self.preview_position_y = 0
+        self.backend = backend
+        self.profile_sizes = dict(capture_profiles or {})
+        self.capture_profiles = {}  # name -> {"size", "config", "sensor_mode"}
+        self.active_profile = None
+        self.preview_size = (self.preview_width, self.preview_height)
         self.camera = None
         self.still_config = None
         self.preview_config = None
+        self.dual_stream_config = None
+        self.lores_width = 0
+        self.lores_height = 0
+        # Recent still capture latencies in milliseconds, per strategy
+        self.shot_latency_ms = {name: deque(maxlen=50) for name in STRATEGIES}
         self.camera_started = False
         self.last_config_was_preview = False
         self.last_photo_width = 0
         self.last_photo_height = 0
         self.camera_is_stopped = True
+        # Serialises camera access between the preview producer and the UI thread
+        self.capture_lock = threading.RLock()
+        # Cleared while the camera warms up after a profile switch, stills wait for it
+        self.profile_ready = threading.Event()
+        self.profile_ready.set()
 
         self._start_camera()
 
     def _start_camera(self):
         """Initialize the Raspberry Pi camera."""
         try:
-            self.camera = Picamera2()
+            if self.backend is None or isinstance(self.backend, str):
+                self.backend = create_backend(self.backend or BACKEND_PICAMERA2)
+            self.camera = self.backend
+            self.recycler = RequestRecycler(self.camera)
             camera_info = self.camera.sensor_resolution
             if camera_info:
                 self.sensor_width, self.sensor_height = camera_info
@@ -74,7 +173,7 @@ class BoothCamera:
             self.preview_config = self.camera.create_preview_configuration(
                 buffer_count=2,  # Reduced from 4 to 2 for less memory usage
                 display="main",
-                transform=Transform(hflip=1),
+                transform=self.camera.transform(hflip=True),
                 main={"size": (preview_width, preview_height), "format": "BGR888"},
                 sensor={'output_size': (self.sensor_width, self.sensor_height)}
             )
@@ -91,15 +190,26 @@ class BoothCamera:
             self.still_config['raw'] = None
             self.still_config['lores'] = None
 
-            # Set camera options & use the preview configuration
-            self.camera.align_configuration(self.preview_config)
-            self.camera.configure(self.preview_config)
+            self.preview_size = (preview_width, preview_height)
+            self._build_capture_profiles()
+
+            if self.strategy == STRATEGY_DUAL_STREAM:
+                # Full resolution stills and a lores preview from the same configuration
+                self.dual_stream_config = self._create_dual_stream_config(self.sensor_width,
+                                                                          self.sensor_height)
+                self.lores_width, self.lores_height = self.dual_stream_config['lores']['size']
+                self.camera.configure(self.dual_stream_config)
+                self._allocate_pre_capture()
+            else:
+                # Set camera options & use the preview configuration
+                self.camera.align_configuration(self.preview_config)
+                self.camera.configure(self.preview_config)
             self.last_photo_width = self.sensor_width
             self.last_photo_height = self.sensor_height
 
             self.camera.start()
             self.camera_is_stopped = False
-            time.sleep(2)  # Allow camera to warm up
+            self._wait_until_ready()  # Allow camera to warm up
 
             # Get camera model (if available)
             if self.camera_model is None or not self.camera_model.strip():
@@ -112,11 +222,184 @@ class BoothCamera:
             self.logger.error("Error initializing camera: %s", e)
             return {"success": False, "message": f"Error initializing camera: {e}"}
 
-    def add_exif_metadata(self, filepath):
-        """Add EXIF metadata to the captured photo."""
-        if not filepath or not os.path.exists(filepath):
-            return {"success": False, "message": "Filepath is None or file does not exist"}
-
+    def _create_dual_stream_config(self, width, height, sensor_mode=None):
+        """Create an aligned dual stream configuration with a width x height main stream."""
+        config = self.camera.create_still_configuration(
+            main={"size": (width, height), "format": "BGR888"},
+            lores={"size": self.preview_size, "format": "YUV420"},
+            buffer_count=3)
+        config['raw'] = None
+        if sensor_mode is not None:
+            config['sensor'] = {"output_size": sensor_mode["size"],
+                                "bit_depth": sensor_mode["bit_depth"]}
+        self.camera.align_configuration(config)
+        return config
+
+    def _allocate_pre_capture(self):
+        """(Re)allocate the pre-capture buffer for the main stream of the dual stream config."""
+        if self.pre_capture_depth <= 0:
+            return
+        main_width, main_height = self.dual_stream_config['main']['size']
+        shape = (main_height, main_width, 3)
+        if self.pre_capture is not None and self.pre_capture.shape == shape:
+            self.pre_capture.clear()
+            return
+        self.pre_capture = None  # Release the previous frames before allocating
+        self.pre_capture = FrameRingBuffer(shape, self.pre_capture_depth,
+                                           self.pre_capture_memory_mb)
+
+    def _select_sensor_mode(self, width, height):
+        """Return the smallest full field of view sensor mode covering width x height.
+
+        Binned modes read out faster, so small tiles get a faster sensor mode.
+        Returns None if the sensor modes are unknown.
+        """
+        candidates = []
+        for mode in self.camera.sensor_modes:
+            mode_width, mode_height = mode["size"]
+            crop = mode.get("crop_limits")
+            if crop and (crop[2] < self.sensor_width or crop[3] < self.sensor_height):
+                continue  # Cropped mode, the field of view would change
+            if mode_width >= width and mode_height >= height:
+                candidates.append(mode)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda mode: (mode["size"][0] * mode["size"][1],
+                                                 -mode.get("fps", 0)))
+
+    def _build_capture_profiles(self):
+        """Build one aligned still configuration per capture profile."""
+        self.capture_profiles = {}
+        for name, (width, height) in self.profile_sizes.items():
+            sensor_mode = self._select_sensor_mode(width, height)
+            if self.strategy == STRATEGY_DUAL_STREAM:
+                config = self._create_dual_stream_config(width, height, sensor_mode)
+            else:
+                config = self.camera.create_still_configuration(
+                    main={"size": (width, height), "format": "BGR888"},
+                    buffer_count=2)
+                config['raw'] = None
+                config['lores'] = None
+                if sensor_mode is not None:
+                    config['sensor'] = {"output_size": sensor_mode["size"],
+                                        "bit_depth": sensor_mode["bit_depth"]}
+                self.camera.align_configuration(config)
+            self.capture_profiles[name] = {
+                "size": config['main']['size'],
+                "config": config,
+                "sensor_mode": sensor_mode["size"] if sensor_mode else None}
+            self.logger.info("Capture profile '%s': %s using sensor mode %s", name,
+                             config['main']['size'], self.capture_profiles[name]["sensor_mode"])
+
+    def select_profile(self, name):
+        """Make a capture profile the active one.
+
+        With the dual stream strategy the camera is reconfigured once here, so the
+        stills of a session need no mode switch and no resizing. The capture lock
+        is released while the camera warms up so the preview keeps running, stills
+        wait for profile_ready instead.
+        """
+        profile = self.capture_profiles.get(name)
+        if profile is None:
+            return
+        with self.capture_lock:
+            if name == self.active_profile:
+                return
+            self.active_profile = name
+            if self.strategy != STRATEGY_DUAL_STREAM or not self.camera_started:
+                return
+            switch_start = time.perf_counter()
+            self.profile_ready.clear()
+            self.dual_stream_config = profile["config"]
+            self.lores_width, self.lores_height = self.dual_stream_config['lores']['size']
+            if not self.camera_is_stopped:
+                self.camera.stop()
+            self.camera.configure(self.dual_stream_config)
+            self._allocate_pre_capture()
+            self.camera.start()
+            self.camera_is_stopped = False
+        try:
+            self._wait_until_ready()
+        finally:
+            self.profile_ready.set()
+        self.logger.info("Switched to capture profile '%s' in %.0f ms", name,
+                         (time.perf_counter() - switch_start) * 1000)
+
+    def _wait_until_ready(self):
+        """Wait until auto exposure and auto white balance have converged.
+
+        The frame metadata is read until ExposureTime, AnalogueGain and ColourGains
+        stay within ready_tolerance of the previous frame for ready_stable_frames
+        frames in a row. Returns True if converged, False if ready_timeout expired.
+        """
+        start = time.monotonic()
+        previous = None
+        stable_frames = 0
+        converged = False
+        while time.monotonic() - start < self.ready_timeout:
+            metadata = self.camera.capture_metadata()
+            current = [metadata.get("ExposureTime", 0), metadata.get("AnalogueGain", 0)]
+            current.extend(metadata.get("ColourGains", ()))
+            if previous is not None and len(previous) == len(current) and \
+               all(abs(a - b) <= self.ready_tolerance * max(abs(a), abs(b), 1e-6)
+                   for a, b in zip(previous, current)):
+                stable_frames += 1
+            else:
+                stable_frames = 0
+            previous = current
+            if stable_frames >= self.ready_stable_frames:
+                converged = True
+                break
+
+        self.last_warmup_ms = (time.monotonic() - start) * 1000
+        if converged:
+            self.logger.info("Camera ready after %.0f ms (AE/AWB stable for %d frames)",
+                             self.last_warmup_ms, stable_frames)
+        else:
+            self.logger.warning("Camera warm-up timed out after %.0f ms, AE/AWB not converged",
+                                self.last_warmup_ms)
+        return converged
+
+    def static_location(self):
+        """Return the (lat, lon) from location_lat/location_long, None if not set."""
+        if not self.location_lat or not self.location_long:
+            return None
+        try:
+            return float(self.location_lat), float(self.location_long)
+        except (TypeError, ValueError) as e:
+            self.logger.error("Invalid static location %r, %r: %s", self.location_lat,
+                              self.location_long, e)
+            return None
+
+    def _location(self):
+        """Return the (lat, lon) to record, or None.
+
+        The recorded location only changes once the position moved more than
+        LOCATION_UPDATE_METRES away from it.
+        """
+        location = self.gps.position() if self.gps is not None else self.static_location()
+        if location is None:
+            self._recorded_location = None
+            return None
+        recorded = self._recorded_location
+        if recorded is not None:
+            # Equirectangular distance, accurate enough at this scale
+            north = math.radians(location[0] - recorded[0])
+            east = math.radians(location[1] - recorded[1]) * \
+                math.cos(math.radians(recorded[0]))
+            if 6_371_000 * math.hypot(north, east) <= LOCATION_UPDATE_METRES:
+                return recorded
+        self._recorded_location = (round(location[0], 5), round(location[1], 5))
+        return self._recorded_location
+
+    def _exif_key(self):
+        """Return the configuration the static EXIF block depends on."""
+        return (self.camera_make, self.camera_model, self.image_description,
+                self.image_artist, self.image_comment, self.software, self.image_keywords,
+                self._location(), time.strftime("%z"))
+
+    def _build_exif_template(self, key):
+        """Build the EXIF block with placeholder timestamps for the current configuration."""
         # Prepare EXIF data using piexif
         exif_dict = {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}, "thumbnail": None}
         # ImageDescription (0th, tag 270)
@@ -135,14 +418,15 @@ class BoothCamera:
         exif_dict["0th"][piexif.ImageIFD.XPComment] = self.image_comment.encode('utf-16')
         # XPKeywords (0th, tag 40094)
         exif_dict["0th"][piexif.ImageIFD.XPKeywords] = self.image_keywords.encode('utf-16')
-        # DateTime (0th, tag 306)
-        dt = time.strftime("%Y:%m:%d %H:%M:%S")
+        # DateTime (0th, tag 306), patched in exif_bytes() for every photo
+        dt = EXIF_DATETIME_PLACEHOLDER.decode('ascii')
         exif_dict["0th"][piexif.ImageIFD.DateTime] = dt
         exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = dt
         exif_dict["Exif"][piexif.ExifIFD.DateTimeDigitized] = dt
-        # GPSLatitude (GPS, tag 2)
-        if hasattr(self, 'location_lat') and self.location_lat:
-            lat = float(self.location_lat)
+        location = key[-2]
+        if location is not None:
+            # GPSLatitude (GPS, tag 2)
+            lat = location[0]
             lat_ref = 'N' if lat >= 0 else 'S'
             lat_deg = int(abs(lat))
             lat_min = int((abs(lat) - lat_deg) * 60)
@@ -151,10 +435,8 @@ class BoothCamera:
                                                            (lat_min, 1),
                                                            (int(lat_sec * 100), 100))
             exif_dict["GPS"][piexif.GPSIFD.GPSLatitudeRef] = lat_ref
-            print(f"GPS coordinates (lat): {lat_deg}°{lat_min}'{lat_sec:.2f}\" {lat_ref}")
-        # GPSLongitude (GPS, tag 4)
-        if hasattr(self, 'location_long') and self.location_long:
-            lon = float(self.location_long)
+            # GPSLongitude (GPS, tag 4)
+            lon = location[1]
             lon_ref = 'E' if lon >= 0 else 'W'
             lon_deg = int(abs(lon))
             lon_min = int((abs(lon) - lon_deg) * 60)
@@ -163,27 +445,55 @@ class BoothCamera:
                                                             (lon_min, 1),
                                                             (int(lon_sec * 100), 100))
             exif_dict["GPS"][piexif.GPSIFD.GPSLongitudeRef] = lon_ref
-            print(f"GPS coordinates (long): {lon_deg}°{lon_min}'{lon_sec:.2f}\" {lon_ref}")
+            self.logger.debug("GPS coordinates: %d°%d'%.2f\" %s, %d°%d'%.2f\" %s",
+                              lat_deg, lat_min, lat_sec, lat_ref,
+                              lon_deg, lon_min, lon_sec, lon_ref)
 
         # OffsetTime (Exif, tag 36880)
-        offset = time.strftime("%z")
+        offset = key[-1]
         if offset:
             offset = offset[:3] + ":" + offset[3:]
             exif_dict["Exif"][36880] = offset
 
-        exif_bytes = piexif.dump(exif_dict)
-        piexif.insert(exif_bytes, filepath)
+        self._exif_template = piexif.dump(exif_dict)
+        self._exif_template_key = key
+        self.logger.debug("EXIF block rebuilt for the current configuration")
+
+    def exif_bytes(self):
+        """Return the EXIF block for a photo taken now.
+
+        The block is built once per configuration, only the timestamps are
+        patched for each photo. Pass the result to save_image(exif=...).
+        """
+        key = self._exif_key()
+        if self._exif_template is None or key != self._exif_template_key:
+            self._build_exif_template(key)
+        dt = time.strftime("%Y:%m:%d %H:%M:%S").encode('ascii')
+        return self._exif_template.replace(EXIF_DATETIME_PLACEHOLDER, dt)
+
+    def add_exif_metadata(self, filepath):
+        """Add EXIF metadata to a photo already written to disk.
+
+        This rewrites the file, prefer passing exif_bytes() to save_image.
+        """
+        if not filepath or not os.path.exists(filepath):
+            return {"success": False, "message": "Filepath is None or file does not exist"}
+
+        piexif.insert(self.exif_bytes(), filepath)
 
         return {"success": True, "message": "EXIF metadata added successfully"}
 
-    def save_image(self, pil_image = None, filepath: str = ""):
-        """Save the image to a file"""
+    def save_image(self, pil_image = None, filepath: str = "", exif: bytes = None):
+        """Save the image to a file, with the EXIF block exif if given"""
         if pil_image is None or filepath is None:
             return {"success": False, "message": "Image or filepath is None"}
 
         try:
             # Convert numpy array to PIL Image
-            pil_image.save(filepath, "JPEG")
+            if exif:
+                pil_image.save(filepath, "JPEG", exif=exif)
+            else:
+                pil_image.save(filepath, "JPEG")
 
             return {"success": True, "message": "Image saved successfully"}
         except Exception as e:  # pylint: disable=W0718
@@ -192,19 +502,48 @@ class BoothCamera:
 
     def stop_camera(self):
         """Stop the camera."""
+        with self.capture_lock:
+            return self._stop_camera()
+
+    def _stop_camera(self):
+        """Stop the camera, the capture lock must be held."""
         if self.camera is not None and self.camera_started:
             try:
                 self.camera.stop()
                 self.camera_is_stopped = True
-                time.sleep(2) # Allow camera to warm up
                 self.logger.info("Camera stopped successfully: %s", self.camera_is_stopped)
                 return {"success": True, "message": "Camera stopped successfully"}
             except Exception as e:  # pylint: disable=W0718
                 self.logger.error("Error stopping camera: %s", e)
                 return {"success": False, "message": f"Error stopping camera: {e}"}
 
-    def take_photo(self, preview=False, width = None, height = None):
-        """Take a photo and return image."""
+    def take_photo(self, preview=False, width = None, height = None, deadline_ns = None,
+                   profile = None):
+        """Take a photo and return image.
+
+        With a pre-capture buffer, deadline_ns (time.monotonic_ns) selects the
+        buffered frame closest to that moment instead of capturing a new one.
+        profile names a capture profile whose prebuilt configuration and size are
+        used instead of width and height.
+        """
+        # A still taken during the warm-up of a profile switch would be mis-exposed
+        self.profile_ready.wait(self.ready_timeout)
+        with self.capture_lock:
+            return self._take_photo(preview, width, height, deadline_ns=deadline_ns,
+                                    profile=self.capture_profiles.get(profile))
+
+    def take_preview_frame(self):
+        """Take a preview frame and return it as an RGB numpy array in "frame".
+
+        The array is not copied or converted to a PIL image, it may be a
+        non-contiguous view (e.g. mirrored) of the camera buffer.
+        """
+        with self.capture_lock:
+            return self._take_photo(True, None, None, as_array=True)
+
+    def _take_photo(self, preview, width, height, as_array=False, deadline_ns=None,
+                    profile=None):
+        """Take a photo and return image, the capture lock must be held."""
         if self.camera is None:
             self.logger.error("Camera not initialized")
             return {"success": False, "pil_image": None, "message": "Camera not initialized"}
@@ -217,27 +556,37 @@ class BoothCamera:
             self.logger.error("Camera not started")
             return {"success": False, "pil_image": None, "message": "Camera not started"}
 
-        if width is None or height is None:
-            width = self.sensor_width
-            height = self.sensor_height
+        if profile is not None:
+            width, height = profile["size"]
+            still_config = profile["config"]
+        else:
+            if width is None or height is None:
+                width = self.sensor_width
+                height = self.sensor_height
 
-        # Ensure width and height are even numbers
-        if width % 2 != 0:
-            width -= 1
-        if height % 2 != 0:
-            height -= 1
+            # Ensure width and height are even numbers
+            if width % 2 != 0:
+                width -= 1
+            if height % 2 != 0:
+                height -= 1
 
-        self.still_config['main']["size"] = (width, height)
+            self.still_config['main']["size"] = (width, height)
+            still_config = self.still_config
 
         # Check if the camera is started
         # The camera may be stopped after a photo was taken
         if self.camera_is_stopped:
             # Restart the camera in preview mode if it was stopped
-            self.camera.configure(self.preview_config)
+            if self.strategy == STRATEGY_DUAL_STREAM:
+                self.camera.configure(self.dual_stream_config)
+                if self.pre_capture is not None:
+                    self.pre_capture.clear()
+            else:
+                self.camera.configure(self.preview_config)
             self.last_config_was_preview = False
             self.camera.start()
             self.camera_is_stopped = False
-            time.sleep(2) # Allow camera to warm up
+            self._wait_until_ready() # Allow camera to warm up
             self.logger.info("Camera started successfully: %s", not self.camera_is_stopped)
 
         # Check that the camera did started successfully
@@ -245,6 +594,10 @@ class BoothCamera:
             self.logger.error("Camera failed to start")
             return {"success": False, "pil_image": None, "message": "Camera failed to start"}
 
+        if self.strategy == STRATEGY_DUAL_STREAM:
+            return self._take_photo_dual_stream(preview, width, height, as_array, deadline_ns)
+
+        shot_start = time.perf_counter()
         if preview != self.last_config_was_preview or \
            (self.last_photo_width != width or self.last_photo_height != height):
             # Reconfigure the camera and take the image
@@ -259,16 +612,220 @@ class BoothCamera:
                 self.camera.options["compress_level"] = 2  # Higher quality compression
                 if "quality" in self.camera.options:
                     del self.camera.options["quality"]  # Use default quality for final photos
-                image = self.camera.switch_mode_and_capture_array(self.still_config, "main")
+                image = self.camera.switch_mode_and_capture_array(still_config, "main")
         else:
-            image = self.camera.capture_array("main")
+            image = self._capture_array("main")
 
         self.last_photo_width = width
         self.last_photo_height = height
 
+        if not preview:
+            self._record_shot_latency(shot_start)
+
         if image is not None:
+            if as_array:
+                return {"success": True, "frame": image[..., :3],
+                        "message": "Image captured successfully"}
             return {"success": True, "pil_image": Image.fromarray(image),
                     "message": "Image captured successfully"}
 
         self.logger.warning("Failed to capture image")
         return {"success": False, "pil_image": None, "message": "Failed to capture image"}
+
+    def _take_photo_dual_stream(self, preview, width, height, as_array=False, deadline_ns=None):
+        """Take a preview or still from the running dual stream configuration."""
+        if preview:
+            if self.pre_capture is not None:
+                image = self._capture_lores_and_buffer_main()
+            else:
+                image = self._capture_array("lores")
+            if image is None:
+                self.logger.warning("Failed to capture preview image")
+                return {"success": False, "pil_image": None,
+                        "message": "Failed to capture preview image"}
+            # The sensor is not flipped in this configuration, mirror the preview
+            rgb = yuv420_to_rgb(image, self.lores_width, self.lores_height)[:, ::-1]
+            if as_array:
+                return {"success": True, "frame": rgb,
+                        "message": "Image captured successfully"}
+            return {"success": True, "pil_image": Image.fromarray(np.ascontiguousarray(rgb)),
+                    "message": "Image captured successfully"}
+
+        shot_start = time.perf_counter()
+        image = None
+        if deadline_ns is not None and self.pre_capture is not None:
+            image, timestamp_ns = self.pre_capture.closest(deadline_ns)
+            if image is not None:
+                self.logger.info("Pre-captured frame is %.1f ms from the deadline",
+                                 (timestamp_ns - deadline_ns) / 1e6)
+            else:
+                self.logger.info("No pre-captured frame near the deadline, capturing live")
+        if image is None:
+            image = self._capture_array("main")
+        self._record_shot_latency(shot_start)
+        if image is None:
+            self.logger.warning("Failed to capture image")
+            return {"success": False, "pil_image": None, "message": "Failed to capture image"}
+
+        pil_image = Image.fromarray(image)
+        if pil_image.size != (width, height):
+            pil_image = pil_image.resize((width, height), Image.LANCZOS, reducing_gap=2.0)
+        return {"success": True, "pil_image": pil_image,
+                "message": "Image captured successfully"}
+
+    def _capture_array(self, name):
+        """Capture an array from a stream, through released requests when kept running."""
+        if self.keep_running:
+            return self.recycler.capture_array(name)
+        return self.camera.capture_array(name)
+
+    def _capture_lores_and_buffer_main(self):
+        """Capture a request, buffer its main stream and return a copy of the lores stream."""
+        def buffer_main(request, metadata):
+            timestamp_ns = metadata.get("SensorTimestamp", time.monotonic_ns())
+            with self.camera.map_stream(request, "main") as array:
+                self.pre_capture.write(array[..., :3], timestamp_ns)
+
+        arrays, _ = self.recycler.capture(("lores",), on_request=buffer_main)
+        return arrays["lores"]
+
+    def end_session(self):
+        """Release the camera after a photo session.
+
+        When kept running, outstanding request buffers are recycled and the camera
+        stays started, otherwise the camera is stopped.
+        """
+        if not self.keep_running:
+            return self.stop_camera()
+        with self.capture_lock:
+            if self.recycler is None or not self.recycler.recycle():
+                # Fall back to a restart if buffers could not be recovered
+                return self._stop_camera()
+            return {"success": True, "message": "Camera buffers recycled"}
+
+    def capture_burst(self, count, period_ms, profile=None):
+        """Capture count frames spaced period_ms apart using sensor timestamps.
+
+        Frames are pulled from the running stream and a frame is kept once its
+        SensorTimestamp reaches the next slot of the schedule, so the spacing does
+        not depend on how long each capture call takes. With the switch mode
+        strategy the camera is configured for the profile once for the whole burst
+        and warmed up before the first frame.
+        Returns {"success", "pil_images", "timestamps_ns", "jitter_ms", "message"}.
+        """
+        profile_info = self.capture_profiles.get(profile)
+        self.profile_ready.wait(self.ready_timeout)
+        with self.capture_lock:
+            if not self.camera_started or self.camera is None:
+                return {"success": False, "pil_images": [], "timestamps_ns": [],
+                        "jitter_ms": None, "message": "Camera not started"}
+            if self.camera_is_stopped:
+                # Let _take_photo restart the camera with its usual configuration
+                self._take_photo(True, None, None, as_array=True)
+
+            reconfigure = self.strategy != STRATEGY_DUAL_STREAM
+            if reconfigure:
+                burst_config = profile_info["config"] if profile_info else self.still_config
+                self.camera.stop()
+                self.camera.configure(burst_config)
+                self.camera.start()
+                # The first frames of the burst must not be taken before AE/AWB settle
+                self._wait_until_ready()
+            try:
+                frames, timestamps = self._capture_scheduled_frames(count, period_ms)
+            finally:
+                if reconfigure:
+                    self.camera.stop()
+                    self.camera.configure(self.preview_config)
+                    self.camera.start()
+                    self.last_config_was_preview = True
+
+        intervals = [(b - a) / 1e6 for a, b in zip(timestamps, timestamps[1:])]
+        jitter_ms = max((abs(interval - period_ms) for interval in intervals), default=0.0)
+        mean_ms = sum(intervals) / len(intervals) if intervals else 0.0
+        self.logger.info("Burst of %d frames: requested %d ms, mean interval %.1f ms, " +
+                         "max jitter %.1f ms", len(frames), period_ms, mean_ms, jitter_ms)
+
+        pil_images = []
+        for frame in frames:
+            pil_image = Image.fromarray(frame)
+            if profile_info and pil_image.size != profile_info["size"]:
+                pil_image = pil_image.resize(profile_info["size"], Image.LANCZOS,
+                                             reducing_gap=2.0)
+            pil_images.append(pil_image)
+        return {"success": len(frames) == count, "pil_images": pil_images,
+                "timestamps_ns": timestamps, "jitter_ms": jitter_ms,
+                "message": f"Captured {len(frames)} of {count} frames"}
+
+    def _capture_scheduled_frames(self, count, period_ms):
+        """Keep the first frame at or after each slot of the schedule, the capture lock
+        must be held."""
+        frames = []
+        timestamps = []
+        period_ns = int(period_ms * 1e6)
+        schedule = {"next_slot_ns": None}
+
+        def keep_if_due(request, metadata):
+            timestamp_ns = metadata.get("SensorTimestamp", time.monotonic_ns())
+            half_frame_ns = metadata.get("FrameDuration", 0) * 500
+            next_slot_ns = schedule["next_slot_ns"]
+            # Accept a frame up to half a frame early, the nearest one to the slot
+            if next_slot_ns is None or timestamp_ns >= next_slot_ns - half_frame_ns:
+                frames.append(request.make_array("main")[..., :3])
+                timestamps.append(timestamp_ns)
+                schedule["next_slot_ns"] = (next_slot_ns or timestamp_ns) + period_ns
+
+        deadline = time.monotonic() + (count * period_ms) / 1000 + 5.0
+        while len(frames) < count and time.monotonic() < deadline:
+            # Only the frames that are kept are copied out of the camera buffers
+            self.recycler.capture((), on_request=keep_if_due)
+        return frames, timestamps
+
+    def _record_shot_latency(self, shot_start):
+        """Record the capture latency of a still and log it against the other strategy."""
+        latency_ms = (time.perf_counter() - shot_start) * 1000
+        self.shot_latency_ms[self.strategy].append(latency_ms)
+        summary = self.latency_summary()
+        if summary["saved_ms"] is None:
+            self.logger.info("Still capture took %.1f ms (%s)", latency_ms, self.strategy)
+        else:
+            self.logger.info("Still capture took %.1f ms (%s), %.1f ms saved per shot " +
+                             "compared to %s", latency_ms, self.strategy, summary["saved_ms"],
+                             STRATEGY_SWITCH_MODE)
+
+    def latency_summary(self):
+        """Return the mean still capture latency per strategy and the latency saved
+        per shot by the dual stream strategy (None until both have been measured)."""
+        means = {name: (sum(values) / len(values) if values else None)
+                 for name, values in self.shot_latency_ms.items()}
+        saved_ms = None
+        if means[STRATEGY_SWITCH_MODE] is not None and means[STRATEGY_DUAL_STREAM] is not None:
+            saved_ms = means[STRATEGY_SWITCH_MODE] - means[STRATEGY_DUAL_STREAM]
+        return {"mean_ms": means, "saved_ms": saved_ms}
+
+    def measure_latency(self, shots: int = 3):
+        """Measure the still capture latency of both strategies on the running camera.
+
+        The switch mode path is measured with switch_mode_and_capture_array, which
+        returns to the current configuration after each still.
+        """
+        if not self.camera_started or self.camera_is_stopped or self.still_config is None:
+            return self.latency_summary()
+
+        self.still_config['main']["size"] = (self.sensor_width, self.sensor_height)
+        for _ in range(shots):
+            shot_start = time.perf_counter()
+            self.camera.switch_mode_and_capture_array(self.still_config, "main")
+            self.shot_latency_ms[STRATEGY_SWITCH_MODE].append(
+                (time.perf_counter() - shot_start) * 1000)
+        if self.strategy == STRATEGY_DUAL_STREAM:
+            for _ in range(shots):
+                shot_start = time.perf_counter()
+                self.camera.capture_array("main")
+                self.shot_latency_ms[STRATEGY_DUAL_STREAM].append(
+                    (time.perf_counter() - shot_start) * 1000)
+
+        summary = self.latency_summary()
+        self.logger.info("Still capture latency per strategy (ms): %s, saved per shot: %s",
+                         summary["mean_ms"], summary["saved_ms"])
+        return summary
@@ -0,0 +1,273 @@
+"""Incremental collage composition for the photobooth.
+
+The collage is set up when a session starts, with the shots placed by the
+button's booth_layouts.Layout, and each shot is handed over as soon as it is
+captured, on a worker thread between shots. When Pillow can join
+JPEG bands (see booth_jpeg), the collage is rendered and written band by band
+as soon as the tiles a band covers have arrived, and the tiles of finished rows
+are dropped, so no full size canvas is ever allocated. Otherwise the tiles are
+pasted into a canvas that is encoded at the end. Either way, when the last shot
+lands only the last rows remain to be rendered.
+
+ReviewBuilder builds the screen sized version of the same collage from shots
+reduced as they arrive, so the guest can review the photo right after the last
+shot while the full resolution collage is still being rendered.
+
+Run this module to compare the peak memory of both ways of rendering.
+"""
+
+import logging
+
+from PIL import Image # type: ignore # pylint: disable=E0401
+
+import booth_jpeg
+
+class CollageBuilder:
+    """Collage filled shot by shot and saved as a JPEG, optionally on an executor."""
+
+    def __init__(self, layout, path: str, executor=None, overlay=None, exif: bytes = None,
+                 band_height: int = 256, banded: bool = None):
+        """Set up a collage of the shots placed by layout (a booth_layouts.Layout).
+
+        path -- JPEG file the collage is written to
+        executor -- concurrent.futures executor the tiles are rendered on, None to
+                    render in the calling thread
+        overlay -- PreparedOverlay covering layout.overlay_box, or a function returning
+                   one (or None), called on the executor when it is first needed
+        exif -- EXIF block of the JPEG file, can also be set until the first tile is added
+        band_height -- rows rendered at a time, rounded up to whole JPEG MCU rows
+        banded -- write band by band, by default when booth_jpeg.bands_supported()
+        """
+        self.log = logging.getLogger(__name__)
+        self.layout = layout
+        self.width, self.height = layout.size
+        self.path = path
+        self.executor = executor
+        self.exif = exif
+        self.band_height = -(-max(1, band_height) // booth_jpeg.MCU_HEIGHT) * \
+            booth_jpeg.MCU_HEIGHT
+        self.banded = booth_jpeg.bands_supported() if banded is None else banded
+        self.added = 0
+        self.finished = False
+        self._overlay = overlay
+        self._futures = []
+        self._tiles = [None] * self.tile_count
+        self._bands = list(layout.bands(self.band_height))  # Bands not written yet
+        self._writer = None
+        self.image = None if self.banded else Image.new("RGB", layout.size, layout.background)
+
+    @property
+    def tile_count(self):
+        """Number of slots in the collage."""
+        return self.layout.tile_count
+
+    def add(self, index: int, tile):
+        """Add tile (a PIL image) in slot index, the shot order of the layout."""
+        if not 0 <= index < self.tile_count:
+            raise IndexError(f"Tile {index} outside the {self.tile_count} slots of the collage")
+        self.added += 1
+        if self.executor is None:
+            self._add(index, tile)
+        else:
+            self._futures.append(self.executor.submit(self._add, index, tile))
+
+    def _add(self, index, tile):
+        """Scale a tile to its slot, then store or paste it."""
+        if tile.size not in (self.layout.shot_size, self.layout.slots[index][2:]):
+            self.log.warning("Tile %d is %dx%d, expected %dx%d", index, tile.width, tile.height,
+                             *self.layout.shot_size)
+        tile = self.layout.fit(index, tile)
+        if not self.banded:
+            self.image.paste(tile, self.layout.slots[index][:2])
+            return
+        self._tiles[index] = tile
+        self._write_ready_bands()
+
+    def _get_overlay(self):
+        """Return the overlay, calling the overlay function the first time."""
+        if callable(self._overlay):
+            self._overlay = self._overlay()
+        return self._overlay
+
+    def _write_ready_bands(self):
+        """Write the bands whose tiles have all arrived, then drop the finished tiles."""
+        while self._bands:
+            top, bottom, indices = self._bands[0]
+            if any(self._tiles[index] is None for index in indices):
+                return
+            if self._writer is None:
+                self._writer = booth_jpeg.BandJpegWriter(self.path, (self.width, self.height),
+                                                         exif=self.exif)
+            self._writer.write(self._render_band(top, bottom, indices))
+            del self._bands[0]
+            for index in indices:
+                _, y, _, height = self.layout.slots[index]
+                if y + height <= bottom:
+                    self._tiles[index] = None
+
+    def _render_band(self, top, bottom, indices):
+        """Return the collage rows top to bottom with the overlay blended in."""
+        band = Image.new("RGB", (self.width, bottom - top), self.layout.background)
+        for index in indices:
+            x, y, width, height = self.layout.slots[index]
+            tile_top = max(top, y) - y
+            tile_bottom = min(bottom, y + height) - y
+            band.paste(self._tiles[index].crop((0, tile_top, width, tile_bottom)),
+                       (x, y + tile_top - top))
+        overlay = self._get_overlay()
+        if overlay is not None:
+            left, overlay_top = self.layout.overlay_box[:2]
+            overlay.composite(band, (-left, top - overlay_top))
+        return band
+
+    def finish(self):
+        """Wait for the pending tiles, write the rest of the collage and return its path."""
+        try:
+            for future in self._futures:
+                future.result()
+            self._futures = []
+            if self.banded:
+                if self._writer is None:
+                    raise ValueError("No complete band of tiles in the collage")
+                self._writer.close()
+            else:
+                overlay = self._get_overlay()
+                if overlay is not None:
+                    left, top = self.layout.overlay_box[:2]
+                    overlay.composite(self.image, (-left, -top))
+                if self.exif:
+                    self.image.save(self.path, "JPEG", exif=self.exif)
+                else:
+                    self.image.save(self.path, "JPEG")
+                self.image = None
+        except Exception:
+            self.abort()
+            raise
+        self.finished = True
+        return self.path
+
+    def abort(self):
+        """Drop the collage unless finish() completed, removing its unfinished file."""
+        if self.finished:
+            return
+        for future in self._futures:
+            future.cancel()
+        for future in self._futures:
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception: # pylint: disable=W0718
+                    pass
+        self._futures = []
+        self._bands = []
+        self._tiles = [None] * self.tile_count
+        self.image = None
+        if self._writer is not None:
+            self._writer.abort()
+            self._writer = None
+
+
+class ReviewBuilder:
+    """Screen sized composite of a collage, built from the shots as they are taken."""
+
+    def __init__(self, layout, max_size: tuple, overlay=None):
+        """Set up the collage of layout (a booth_layouts.Layout) shrunk to fit max_size.
+
+        overlay -- PreparedOverlay covering the shrunk overlay box, or a function
+                   returning one (or None), called by finish()
+        """
+        self.layout = layout
+        self.size, self.slots, self.overlay_box = layout.scaled(max_size)
+        self.image = Image.new("RGB", self.size, layout.background)
+        self._overlay = overlay
+
+    def add(self, index: int, tile):
+        """Shrink tile (a PIL image) and paste it in slot index."""
+        x, y, width, height, reduction = self.slots[index]
+        # Box reduction to about the slot size, only a small image is resampled
+        if reduction > 1 and tile.size == self.layout.shot_size:
+            tile = tile.reduce(reduction)
+        self.image.paste(tile.resize((width, height), Image.BILINEAR), (x, y))
+
+    def finish(self):
+        """Return the composite (RGB PIL image) with the overlay blended in."""
+        overlay = self._overlay() if callable(self._overlay) else self._overlay
+        if overlay is not None:
+            overlay.composite(self.image, (-self.overlay_box[0], -self.overlay_box[1]))
+        return self.image
+
+
+def _peak_rss_kb(reset: bool = False):
+    """Return the peak resident memory of the process in kB (Linux), resetting it first."""
+    if reset:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as clear_refs:
+            clear_refs.write("5")
+    with open("/proc/self/status", "r", encoding="utf-8") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    raise OSError("No VmHWM in /proc/self/status")
+
+
+def _measure_peak(banded: bool):
+    """Render a Nine Square collage with an overlay, return the peak memory growth in MB.
+
+    Tiles are created one at a time like captured shots. Returns the growth of
+    the process's peak resident memory and the tracemalloc peak (numpy buffers).
+    """
+    # Imported here, only the memory check needs them
+    import os # pylint: disable=C0415
+    import tempfile # pylint: disable=C0415
+    import tracemalloc # pylint: disable=C0415
+    import numpy as np # pylint: disable=C0415
+    from booth_overlays import PreparedOverlay # pylint: disable=C0415
+    from booth_layouts import layout_for # pylint: disable=C0415
+
+    tile_size = (1093, 821)
+    layout = layout_for({"photo_size": tile_size, "photo_count": 9})
+    size = layout.size
+    # Mostly transparent frame: a border and a logo in one corner
+    overlay_image = Image.new("RGBA", size)
+    overlay_image.paste((255, 255, 255, 255), (0, 0, size[0], 40))
+    overlay_image.paste((255, 255, 255, 255), (0, size[1] - 40, size[0], size[1]))
+    overlay_image.paste((20, 40, 200, 160), (size[0] - 600, size[1] - 400, size[0], size[1]))
+    overlay = PreparedOverlay(overlay_image)
+    overlay_image = None
+    gradient = np.linspace(0, 255, tile_size[0], dtype=np.uint8)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, "collage.jpg")
+        baseline_kb = _peak_rss_kb(reset=True)
+        tracemalloc.start()
+        builder = CollageBuilder(layout, path, overlay=overlay, banded=banded)
+        for index in range(layout.tile_count):
+            pixels = np.empty((tile_size[1], tile_size[0], 3), dtype=np.uint8)
+            pixels[...] = ((gradient.astype(np.uint16) + index * 28) % 256)[None, :, None]
+            builder.add(index, Image.fromarray(pixels, "RGB"))
+            pixels = None
+        builder.finish()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_kb = _peak_rss_kb()
+    return (peak_kb - baseline_kb) / 1024, traced_peak / (1024 * 1024)
+
+
+if __name__ == "__main__":
+    # Each renderer is measured in a fresh process, the peak resident memory
+    # of a process only goes up
+    import sys
+    import subprocess
+    if len(sys.argv) > 1:
+        print(*_measure_peak(sys.argv[1] == "banded"))
+        sys.exit(0)
+
+    peaks = {}
+    for mode in ("canvas", "banded"):
+        output = subprocess.run([sys.executable, __file__, mode], check=True,
+                                capture_output=True, text=True).stdout.split()
+        peaks[mode] = (float(output[0]), float(output[1]))
+        print(f"{mode}: peak memory growth {peaks[mode][0]:.1f} MB, " +
+              f"traced peak {peaks[mode][1]:.1f} MB")
+    # Banded: a row of tiles (3 x 1093 x 821 x 4 bytes = 10.3 MB) plus a band
+    assert peaks["banded"][0] < 24, "Banded rendering peak memory above 24 MB"
+    assert peaks["banded"][1] < 8, "Banded rendering traced peak above 8 MB"
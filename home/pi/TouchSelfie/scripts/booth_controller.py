@@ -4,24 +4,38 @@ import os
 import shutil
 import time
 import logging
-import math
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
-from PIL import Image # type: ignore # pylint: disable=E0401
+from PIL import Image, ImageOps # type: ignore # pylint: disable=E0401
 
-import helpers
 import constants
 from configuration import Configuration
 from booth_model import BoothModel
 from booth_view import BoothView
 from booth_camera import BoothCamera
 from booth_google import BoothGoogle
+from booth_preview import PreviewProducer
+from booth_encoder import PhotoEncoder
+from booth_gps import GpsdClient
+from booth_timing import Deadline, PeriodicTimer
+from booth_storage import WorkingStorage
+from booth_collage import CollageBuilder, ReviewBuilder
+from booth_layouts import layout_for
+from booth_overlays import OverlayCache
+from booth_gif import save_animation
+from booth_session import (PhotoSession, STATE_COUNTDOWN, STATE_CAPTURE, STATE_ASSEMBLE,
+                           STATE_REVIEW, STATE_PUBLISH)
 
 class BoothController:
     """Controller class for managing the booth application."""
 
-    def __init__(self):
-        """Initialize the BoothController."""
+    def __init__(self, backend=None, view_class=BoothView):
+        """Initialize the BoothController.
+
+        backend -- CameraBackend to use, constants.CAMERA_BACKEND if None
+        view_class -- class of the view, called with the controller
+        """
         # Set up logging
         if not os.path.exists(constants.LOGS_FOLDER):
             os.makedirs(constants.LOGS_FOLDER)
@@ -42,11 +56,23 @@ class BoothController:
 
         self.camera = BoothCamera(
             screen_width=800,
-            screen_height=480
+            screen_height=480,
+            strategy=constants.CAMERA_STRATEGY,
+            pre_capture_depth=constants.PRE_CAPTURE_DEPTH,
+            pre_capture_memory_mb=constants.PRE_CAPTURE_MEMORY_MB,
+            ready_timeout=constants.CAMERA_READY_TIMEOUT,
+            ready_stable_frames=constants.CAMERA_READY_STABLE_FRAMES,
+            ready_tolerance=constants.CAMERA_READY_TOLERANCE,
+            keep_running=constants.CAMERA_KEEP_RUNNING,
+            backend=backend or constants.CAMERA_BACKEND,
+            capture_profiles={button["name"]: button["photo_size"]
+                              for button in constants.BUTTONS if "photo_size" in button}
         )
+        if constants.CAMERA_MEASURE_LATENCY:
+            self.camera.measure_latency()
         self.configuration = Configuration(constants.CONFIGURATION_FILE)
         self.model = BoothModel()
-        self.view = BoothView(self)
+        self.view = view_class(self)
 
         self.camera.screen_width = self.view.screen_width
         self.camera.screen_height = self.view.screen_height
@@ -61,15 +87,59 @@ class BoothController:
         self.camera.image_keywords = self.configuration.image_keywords
         self.camera.location_lat = self.configuration.location_lat
         self.camera.location_long = self.configuration.location_long
+        # Location for the EXIF data from gpsd, kept up to date in the background
+        self.gps = None
+        if self.configuration.gps_enabled:
+            fallback = None
+            if self.configuration.gps_fallback_to_static:
+                fallback = self.camera.static_location()
+            self.gps = GpsdClient(self.configuration.gps_host, self.configuration.gps_port,
+                                  max_fix_age=self.configuration.gps_max_fix_age,
+                                  fallback=fallback)
+            self.gps.start()
+            self.camera.gps = self.gps
 
         self.google_handler = BoothGoogle()
         self.suspend_preview = False
         self.last_photo_path = None
         self.usb_archive_path = None
+        self.session = None  # PhotoSession of the last photo button clicked
+        self.sessions = []  # Sessions started and not ended yet
 
         # Performance optimizations
         self.thread_pool = ThreadPoolExecutor(max_workers=2)
+        # Session files are kept in RAM when possible, only final photos go to the SD card
+        self.storage = WorkingStorage(constants.WORKING_STORAGE_FOLDER, constants.TEMP_FOLDER,
+                                      budget_mb=constants.WORKING_STORAGE_BUDGET_MB,
+                                      min_free_memory_mb=constants.WORKING_STORAGE_MIN_FREE_MB)
+        # Remove the session folders left behind by a crash or power cut
+        # Listed now, before a session can allocate its folder, and removed in the background
+        self.thread_pool.submit(self._delete_temp_files, self._leftover_files())
+        # Collage geometry is computed once per layout, invalid layouts are logged here
+        for button in constants.BUTTONS:
+            self._collage_layout(button)
+        # Scale the foreground overlays to their collage sizes ahead of the first session
+        self.overlays = OverlayCache()
+        self.thread_pool.submit(self.overlays.prepare,
+                                [overlay for button in constants.BUTTONS
+                                 if button.get("foreground_image")
+                                 for overlay in self._overlays_of(button)])
         self.upload_queue = []
+        # Stills are JPEG encoded off the UI thread, keyed by file path
+        self.encoder = PhotoEncoder(self.camera.save_image,
+                                    max_workers=constants.ENCODER_WORKERS,
+                                    max_pending=constants.ENCODER_MAX_PENDING)
+        self.pending_encodes = {}
+        # Photos are assembled one session at a time, off the UI thread when
+        # sessions are pipelined
+        self.assembly_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Assemble")
+        # Shots are pasted into the collage between shots
+        self.collage_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Collage")
+
+        # Preview frames are captured on their own thread, the UI shows the newest one
+        self.preview_producer = PreviewProducer(self.camera,
+                                                max_fps=1000 / self.view.poll_interval)
+        self.preview_producer.start()
 
         self.log.info("os.path.expanduser('~'): %s", os.path.expanduser('~'))
         print(f"os.path.expanduser('~'): {os.path.expanduser('~')}")
@@ -81,217 +151,565 @@ class BoothController:
         self.log.info("Starting Photobooth UI")
         self.view.main()
 
-    def _assemble_animation(self, button, photos):
-        """Assemble an annimation from the list of photos taken."""
-        if not button or not photos or len(photos) == 0:
-            self.view.update_status("No photos taken.")
+    def _assemble_animation(self, button, images, work_dir):
+        """Assemble an annimation from the list of images taken into work_dir."""
+        if not button or not images or len(images) == 0:
+            self._update_status("No photos taken.")
             self.log.warning("No photos taken.")
             return None
 
-        for photo in photos:
-            if not os.path.exists(photo):
-                self.view.update_status(f"Photo does not exist. {photo}")
-                self.log.warning("Photo does not exist. %s", photo)
-                return None
-
         gif_period_millis = int(button["gif_period_millis"]) or 50
         self.log.info("Creating animated GIF with %d photos, period %d ms.",
-                         len(photos), gif_period_millis)
-        for photo_filename in photos:
-            if not os.path.exists(photo_filename):
-                self.view.update_status(f"Photo {photo_filename} does not exist.")
-                self.log.warning("Photo %s does not exist.", photo_filename)
-                return None
+                         len(images), gif_period_millis)
 
         self.log.debug("Assembling animation")
 
-        animation_filename = os.path.join(constants.TEMP_FOLDER, "animation.gif")
+        animation_filename = os.path.join(work_dir, "animation.gif")
 
-        # Optimize GIF creation with PIL instead of ImageMagick for better performance
         try:
-            images = []
-            for photo_filename in photos:
-                img = Image.open(photo_filename)
-                # Resize for faster processing while maintaining quality
-                img.thumbnail((800, 600), Image.LANCZOS)
-                images.append(img)
-
-            # Create optimized GIF
-            images[0].save(
-                animation_filename,
-                save_all=True,
-                append_images=images[1:],
-                duration=gif_period_millis,
-                loop=0,
-                optimize=True,
-                quality=85
-            )
+            # Resize for faster processing while maintaining quality
+            frames = [ImageOps.contain(image, constants.GIF_FRAME_SIZE, Image.LANCZOS)
+                      for image in images]
 
+            # One palette for all frames, only the changed part of each frame
+            save_animation(frames, animation_filename, gif_period_millis,
+                           tolerance=constants.GIF_DELTA_TOLERANCE)
         except Exception as e: # pylint: disable=W0718
-            self.log.error("Failed to create GIF with PIL, falling back to ImageMagick: %s", e)
-            # Fallback to original ImageMagick method
-            command_string = f"convert -delay {gif_period_millis} " + \
-                f"{os.path.join(constants.TEMP_FOLDER,'photo_')}*.jpg " + \
-                    f"{animation_filename}"
-            os.system(command_string)
+            self.log.error("Failed to create GIF: %s", e)
         if not os.path.exists(animation_filename):
-            self.view.update_status("Failed to create animated GIF.")
+            self._update_status("Failed to create animated GIF.")
             self.log.warning("Failed to create animated GIF.")
             return None
 
         return animation_filename
 
-    def _assemble_collage(self, button, photos):
-        """Assemble a photo from the list of photos taken."""
-        if not button or not photos or len(photos) == 0:
-            self.view.update_status("No photos taken.")
+    def _shot_size(self, button):
+        """Return the size of the shots the camera delivers for a photo button."""
+        profile = self.camera.capture_profiles.get(button.get("name"))
+        if profile is not None:
+            # The camera may align the button's photo_size, e.g. to even sizes
+            return tuple(profile["size"])
+        return tuple(button["photo_size"]) if "photo_size" in button else None
+
+    def _collage_layout(self, button):
+        """Return the cached Layout of a collage button, None if it has none."""
+        try:
+            return layout_for(button, self._shot_size(button))
+        except ValueError as e:
+            self.log.error("Invalid layout of %s: %s", button.get("name"), e)
+            return None
+
+    def _overlays_of(self, button):
+        """Return the (foreground image path, size it is scaled to) pairs of a button.
+
+        Collages have their foreground image at full size and at the review size.
+        """
+        layout = self._collage_layout(button)
+        if layout is None:
+            return [(button["foreground_image"], tuple(button["photo_size"]))]
+        review_box = layout.scaled(constants.REVIEW_SIZE)[2]
+        return [(button["foreground_image"], layout.overlay_size),
+                (button["foreground_image"], review_box[2:])]
+
+    def _collage_overlay(self, button, size):
+        """Return the prepared foreground image of a button at size, None if it has none."""
+        if not button.get("foreground_image"):
+            return None
+        # Foreground image resized to fit the assembled photo size
+        overlay = self.overlays.get(button["foreground_image"], size)
+        if overlay is None:
+            self._update_status(f"Foreground image {button['foreground_image']} " +
+                                "does not exist.")
+        return overlay
+
+    def _collage_builder(self, button, work_dir, executor=None):
+        """Return a CollageBuilder writing the collage of button to work_dir."""
+        layout = self._collage_layout(button)
+        return CollageBuilder(layout, os.path.join(work_dir, "assembled_photo.jpg"),
+                              executor=executor,
+                              overlay=lambda: self._collage_overlay(button,
+                                                                    layout.overlay_size))
+
+    def _review_builder(self, button):
+        """Return a ReviewBuilder of the collage of button at the review size."""
+        layout = self._collage_layout(button)
+        overlay_size = layout.scaled(constants.REVIEW_SIZE)[2][2:]
+        return ReviewBuilder(layout, constants.REVIEW_SIZE,
+                             overlay=lambda: self._collage_overlay(button, overlay_size))
+
+    def _assemble_collage(self, button, images, work_dir, builder=None):
+        """Assemble a photo from the list of images taken into work_dir.
+
+        builder -- CollageBuilder the shots were already added to, images is then ignored
+        """
+        shots = builder.added if builder is not None else len(images or [])
+        if not button or shots == 0:
+            self._update_status("No photos taken.")
             self.log.warning("No photos taken.")
             return None
 
         photo_count = button.get("photo_count", 1)
-        if photo_count != len(photos):
-            self.view.update_status(f"Expected {photo_count} photos, but got {len(photos)}.")
-            self.log.warning("Expected %d photos, but got %d.", photo_count, len(photos))
+        if photo_count != shots:
+            self._update_status(f"Expected {photo_count} photos, but got {shots}.")
+            self.log.warning("Expected %d photos, but got %d.", photo_count, shots)
             return None
 
-        photos_sqr = int(math.sqrt(photo_count))
-        if photos_sqr * photos_sqr != photo_count:
-            self.view.update_status(f"Photo count {photo_count} is not a perfect square.")
-            self.log.warning("Photo count %d is not a perfect square.", photo_count)
+        if self._collage_layout(button) is None:
+            self._update_status(f"No collage layout for {photo_count} photos.")
+            self.log.warning("No collage layout for %d photos.", photo_count)
             return None
 
-        photo_index = 0
-        temp_image = Image.open(photos[photo_index])
-        photo_width = temp_image.width
-        photo_height = temp_image.height
-        temp_image = None
-        collage_width = photo_width * photos_sqr
-        collage_height = photo_height * photos_sqr
-        collage = Image.new('RGBA', (collage_width, collage_height))
-        # print(f"Complete image size: {snapshot_width}x{snapshot_height}")
-        # self.handle_exit()
+        if builder is None:
+            builder = self._collage_builder(button, work_dir)
+            builder.exif = self.camera.exif_bytes()
+            for index, image in enumerate(images):
+                builder.add(index, image)
         self.log.info("Creating collage of size %dx%d from %d photos.",
-                         collage_width, collage_height, photo_count)
-        for i in range(photos_sqr):
-            for j in range(photos_sqr):
-                if not os.path.exists(photos[photo_index]):
-                    self.view.update_status(f"Photo {photos[photo_index]} does not exist.")
-                    return None
-                im = Image.open(photos[photo_index])
-                collage.paste(im, (j * photo_width,   i * photo_height,
-                                    (j + 1) * photo_width, (i + 1) * photo_height))
-                photo_index += 1
-
-        # Add foreground image if specified
-        if "foreground_image" in button and button["foreground_image"]:
-            if not os.path.exists(button["foreground_image"]):
-                self.view.update_status(f"Foreground image {button['foreground_image']} " +
-                                        "does not exist.")
-            else:
-                frame_image = Image.open(button["foreground_image"])
-                # Resize foreground image to fit the assembled photo size
-                frame_image = frame_image.resize((collage_width,collage_height), Image.ANTIALIAS)
-                frame_image = frame_image.convert("RGBA")
-                collage = collage.convert('RGBA')
-                # Paste the foreground image on top of the assembled photo
-                collage = Image.alpha_composite(collage, frame_image)
-                self.log.info("Foreground image added to the assembled photo.")
-
-        # Save the assembled photo to a temporary file
-        assembled_photo_path = os.path.join(constants.TEMP_FOLDER, "assembled_photo.jpg")
-        collage = collage.convert('RGB')
-        collage.save(assembled_photo_path)
-        self.camera.add_exif_metadata(assembled_photo_path)
+                         builder.width, builder.height, photo_count)
+        # The builder blends in the foreground image and saves the collage with its EXIF
+        assembled_photo_path = builder.finish()
 
         return assembled_photo_path
 
-    def _countdown_and_take_photos(self, button):
-        """Handle countdown and take photos based on the button clicked."""
-        photo_last_ms = helpers.millis()
-        current_ms = helpers.millis()
+    def _sessions_in_flight(self):
+        """Return the sessions that have not ended yet."""
+        return [session for session in self.sessions if session.active]
+
+    def _capturing(self):
+        """True while a session counts down or takes photos."""
+        return any(session.state in (STATE_COUNTDOWN, STATE_CAPTURE)
+                   for session in self._sessions_in_flight())
+
+    def _view_taken(self, session):
+        """True if another session is counting down, taking photos or in review."""
+        return any(other is not session and
+                   other.state in (STATE_COUNTDOWN, STATE_CAPTURE, STATE_REVIEW)
+                   for other in self._sessions_in_flight())
+
+    def _room_for_session(self):
+        """True if a new session may start now."""
+        return (not self._capturing() and
+                len(self._sessions_in_flight()) < max(1, constants.SESSIONS_IN_FLIGHT))
+
+    def _update_status(self, message):
+        """Show message in the view, from the UI thread or a worker thread."""
+        if threading.current_thread() is threading.main_thread():
+            self.view.update_status(message)
+        else:
+            self.view.after(0, self.view.update_status, message)
+
+    def _start_session(self, button):
+        """Start a photo session for button, its steps run from view.after() callbacks."""
+        if not self._room_for_session():
+            self.log.warning("Sessions still running, ignoring %s", button["name"])
+            self.view.update_status("Still processing the last photo, please wait...")
+            return
+        self.view.hide_buttons()
+        self.session = PhotoSession(button, self.view, on_error=self._session_error)
+        self.session.work_dir = self.storage.allocate(f"session_{self.session.session_id}",
+                                                      self._estimate_session_mb(button))
+        layout = self._collage_layout(button)
+        if button["name"] != "Animated GIF" and layout is not None:
+            self.session.collage = self._collage_builder(button, self.session.work_dir,
+                                                         executor=self.collage_pool)
+            self.session.review = self._review_builder(button)
+        if button.get("foreground_image"):
+            # Rescale the overlays during the countdown if their file was changed
+            self.thread_pool.submit(self.overlays.prepare, self._overlays_of(button))
+        # Only the UI thread changes the list, ended sessions are dropped here
+        self.sessions = self._sessions_in_flight() + [self.session]
+        self._session_countdown(self.session)
+
+    def _estimate_session_mb(self, button):
+        """Return a generous estimate of the MB a session of button writes.
+
+        Only the assembled photo is written to the session folder, the shots stay
+        in memory or go straight into the collage.
+        """
+        count = button.get("photo_count", 1)
+        if button["name"] == "Animated GIF":
+            # A byte per pixel of every frame, before LZW compression
+            width, height = constants.GIF_FRAME_SIZE
+            return count * width * height / (1024 * 1024)
+        layout = self._collage_layout(button)
+        if layout is None:
+            # Nothing is assembled without a collage layout
+            return 0
+        # JPEGs stay well below a byte per pixel
+        return layout.width * layout.height / (1024 * 1024)
+
+    def _session_countdown(self, session):
+        """Start the countdown, the preview keeps updating from the poll timer."""
+        session.enter(STATE_COUNTDOWN)
         self.view.update_status("Counting down to take photo...")
         self.log.info("Counting down to take photo...")
+        # A review of the previous session may still be on screen
+        self.suspend_preview = False
 
-        self._delete_temp_files()
+        # Switch the camera to this button's capture profile while the countdown runs
+        threading.Thread(target=self.camera.select_profile, args=(session.button["name"],),
+                         name="SelectProfile", daemon=True).start()
 
-        # Wait for the countdown to finish
-        countdown_last_ms = helpers.millis()
-        countdown_running = self.view.show_countdown(99)
-        while countdown_running:
-            # Update the view and check for events
-            self.view.update()
-
-            # Change the countdown overlay every second
-            current_ms = helpers.millis()
-            if (current_ms - countdown_last_ms) >= 1000:
-                countdown_last_ms = current_ms
-                countdown_running = self.view.show_countdown()
-
-            # Update the preview image during countdown
-            if (current_ms - photo_last_ms) >= self.view.poll_interval:
-                photo_last_ms = current_ms
-                if not self.suspend_preview:
-                    self.update_preview_image()
-
-        # Take the photo after the countdown
-        ms_between_photos = button.get("snap_period_millis", 1000)
+        if self.view.show_countdown(99):
+            session.countdown_timer = PeriodicTimer(1000)
+            session.schedule(session.countdown_timer.remaining_ms(),
+                             self._session_countdown_tick, session)
+        else:
+            self._session_capture(session)
+
+    def _session_countdown_tick(self, session):
+        """Change the countdown overlay every second, then take the photos."""
+        if not session.countdown_timer.due():
+            # Woken up early, wait for the rest of the second
+            session.schedule(session.countdown_timer.remaining_ms(),
+                             self._session_countdown_tick, session)
+        elif self.view.show_countdown():
+            session.schedule(session.countdown_timer.remaining_ms(),
+                             self._session_countdown_tick, session)
+        else:
+            self._session_capture(session)
+
+    def _session_capture(self, session):
+        """Take the first photo (or the burst) right after the countdown."""
+        session.enter(STATE_CAPTURE)
+        # The moment the photo is due, used to pick the pre-captured frame
+        deadline_ns = time.monotonic_ns()
+        # The previews of the stills replace the live preview until the capture ends
+        self.suspend_preview = True
+        # Stills and preview frames must not interleave on the camera, unless the
+        # preview keeps filling the pre-capture buffer the stills are taken from
+        if self.camera.pre_capture is None:
+            self.preview_producer.pause()
+
+        if not os.path.exists(session.work_dir):
+            os.makedirs(session.work_dir)
+        button = session.button
+        if button.get("burst"):
+            self._take_burst(session, button.get("photo_count", 1),
+                             button.get("snap_period_millis", 1000))
+            return
+        session.snap_timer = PeriodicTimer(button.get("snap_period_millis", 1000))
+        self._session_snap(session, deadline_ns)
+
+    def _session_snap(self, session, deadline_ns):
+        """Take the next photo and schedule the one after it."""
+        button = session.button
         number_of_photos = button.get("photo_count", 1)
-        photos_taken = 0
-        photos = []  # List to store paths of photos taken
-        countdown_last_ms = helpers.millis()
-        if not os.path.exists(constants.TEMP_FOLDER):
-            os.makedirs(constants.TEMP_FOLDER)
-        # Take first photo immediately after countdown
-        photo_file = os.path.join(constants.TEMP_FOLDER, f"photo_{photos_taken + 1}.jpg")
+        shot_file = self._shot_path(session, session.shots + 1)
         self.view.update_status("Taking photo...")
-        status = self.take_photo_save_to_file(
-            filepath=photo_file,
+        pil_image = self.take_session_photo(
             width=button["photo_size"][0],
-            height=button["photo_size"][1]
+            height=button["photo_size"][1],
+            deadline_ns=deadline_ns,
+            profile=button["name"],
+            filepath=shot_file
         )
-        if status:
-            photos_taken += 1
-            photos.append(photo_file)
-            self.view.update_status(f"Photo {photos_taken} of {number_of_photos} taken.")
-        while photos_taken < number_of_photos:
-            # Update the view and check for events
-            self.view.update()
-
-            # Take a photo
-            current_ms = helpers.millis()
-            if (current_ms - countdown_last_ms) >= ms_between_photos:
-                countdown_last_ms = current_ms
-                # Take the next photo
-                photo_file = os.path.join(constants.TEMP_FOLDER,
-                                            f"photo_{photos_taken + 1}.jpg")
-                self.view.update_status("Taking photo...")
-                status = self.take_photo_save_to_file(
-                    filepath=photo_file,
-                    width=button["photo_size"][0],
-                    height=button["photo_size"][1]
-                )
-                if status:
-                    photos_taken += 1
-                    photos.append(photo_file)
-                    self.view.update_status(f"Photo {photos_taken} of " +
-                                            f"{number_of_photos} taken.")
-
-            # If it's the last photo, update the status
-            if photos_taken == number_of_photos:
-                self.view.update_status("Photos taken successfully.")
-        return photos
-
-    def _delete_temp_files(self):
-        """Removes all files from the temp folder."""
-
-        # Use glob to find all files ending with .jpg or .JPG
-        for filename in os.listdir(constants.TEMP_FOLDER):
-            file_path = os.path.join(constants.TEMP_FOLDER, filename)
+        if pil_image is not None:
+            self._add_frame(session, pil_image)
+            if shot_file:
+                session.photos.append(shot_file)
+            self.view.update_status(f"Photo {session.shots} of " +
+                                    f"{number_of_photos} taken.")
+
+        if session.shots < number_of_photos:
+            session.schedule(session.snap_timer.remaining_ms(), self._session_snap_due, session)
+        else:
+            self.view.update_status("Photos taken successfully.")
+            self._session_end_capture(session)
+
+    def _session_snap_due(self, session):
+        """Take the next photo once the snap timer is due."""
+        if session.snap_timer.due():
+            self._session_snap(session, session.snap_timer.last_deadline_ns)
+        else:
+            session.schedule(session.snap_timer.remaining_ms(), self._session_snap_due, session)
+
+    def _session_end_capture(self, session):
+        """Release the camera and hand the photos over for assembly."""
+        self.preview_producer.pause()
+        # Request buffers are recycled so the camera can keep running, or the
+        # camera is stopped so its buffers cannot fill up.
+        self.camera.end_session()
+        session.enter(STATE_ASSEMBLE)
+
+        if session.review is not None and session.shots > 0:
+            self._session_review_first(session)
+            return
+
+        if constants.SESSIONS_IN_FLIGHT > 1:
+            # Assemble in the background, the next guest can start right away
+            self.suspend_preview = False
+            self.preview_producer.resume()
+            if self._room_for_session():
+                self.view.show_buttons()
+            self.view.update_status("Processing photo...")
+            self.assembly_pool.submit(self._session_process, session)
+            return
+
+        # Show an information image while processing the photos
+        self.view.show_image(os.path.join(constants.RESOURCES_FOLDER, "processing.png"))
+        # Let the view draw it before the UI thread is busy assembling
+        session.schedule(0, self._session_assemble, session)
+
+    def _session_review_first(self, session):
+        """Show the screen sized collage now, render the full resolution one in a worker."""
+        review_image = session.review.finish()
+        session.review = None
+        self.assembly_pool.submit(self._session_process, session)
+
+        session.enter(STATE_REVIEW)
+        session.review_shown_ns = time.monotonic_ns()
+        session.review_hold = Deadline(constants.REVIEW_HOLD_MILLIS)
+        self.log.info("Session %s ready for review %d ms after the last shot",
+                      session.session_id,
+                      (session.review_shown_ns - session.last_shot_ns) // 1_000_000)
+        self.suspend_preview = True
+        self.view.update_preview_image(review_image)
+        self.view.update_status("Processing photo...")
+        if constants.SESSIONS_IN_FLIGHT > 1:
+            # The next guest can start while the photo is reviewed and rendered
+            self.preview_producer.resume()
+            if self._room_for_session():
+                self.view.show_buttons()
+
+    def _session_assemble(self, session):
+        """Assemble the photos on the UI thread, then show the result for review."""
+        self._session_assembled(session, self._assemble_and_archive(session))
+
+    def _session_process(self, session):
+        """Assemble the photos in a worker thread and pass the result to the UI thread."""
+        try:
+            archive_path = self._assemble_and_archive(session)
+        except Exception as e: # pylint: disable=W0718
+            self.log.error("Failed to process session %s: %s", session.work_dir, e)
+            archive_path = None
+        session.schedule(0, self._session_assembled, session, archive_path)
+
+    def _assemble_and_archive(self, session):
+        """Wait for the photos, assemble and archive them, return the archived path or None."""
+        button = session.button
+        if session.shots == 0:
+            self._update_status("No photos taken.")
+            self.log.warning("No photos taken.")
+            return None
+
+        # The shots are assembled from the captured images, not from JPEG files
+        if button["name"] == "Animated GIF":
+            # Assemble the animation from the photos taken
+            session.assembled_image = self._assemble_animation(button, session.frames,
+                                                               session.work_dir)
+        else:
+            # Assemble the photo from the photos taken
+            session.assembled_image = self._assemble_collage(button, session.frames,
+                                                             session.work_dir, session.collage)
+        # The full resolution shots are not needed any more
+        session.frames = []
+        if session.collage is not None:
+            # Closes the collage file if it was not finished, e.g. shots were missing
+            session.collage.abort()
+        session.collage = None
+
+        if session.assembled_image is None:
+            self._update_status("Failed to assemble the photo.")
+            self.log.warning("Failed to assemble the photo.")
+            return None
+
+        # Archive the final assembled image
+        # Named by session, pipelined sessions can be archived within the same second
+        photo_filename = f"photo_{session.session_id}"
+        if button["name"] == "Animated GIF":
+            photo_filename += ".gif"
+        else:
+            photo_filename += ".jpg"
+
+        os.makedirs(constants.ARCHIVE_FOLDER, exist_ok=True)
+        archive_path = os.path.join(constants.ARCHIVE_FOLDER, photo_filename)
+        self.log.info("Archiving final photo to %s", archive_path)
+        shutil.copy2(session.assembled_image, archive_path)
+        return archive_path
+
+    def _session_assembled(self, session, archive_path):
+        """Show the archived photo for review, unless the next guest is being photographed."""
+        if archive_path is None:
+            # The reason is already shown in the status
+            self._session_end(session)
+            return
+        self.last_photo_path = archive_path
+        session.archive_path = archive_path
+        if session.review_shown_ns is not None:
+            # The review has been on screen since the capture ended
+            shown_ms = (time.monotonic_ns() - session.review_shown_ns) / 1_000_000
+            self.log.info("Session %s rendered %d ms after the review was shown",
+                          session.session_id, shown_ms)
+            if not self._view_taken(session):
+                self.view.update_status("Photo processed successfully.")
+            session.schedule(session.review_hold.remaining_ms(), self._session_review_due,
+                             session)
+            return
+        if session.last_shot_ns is not None:
+            self.log.info("Session %s ready for review %d ms after the last shot",
+                          session.session_id,
+                          (time.monotonic_ns() - session.last_shot_ns) // 1_000_000)
+
+        session.enter(STATE_REVIEW)
+        if self._capturing():
+            # Do not cover the countdown or the photos of the next session
+            self._session_publish(session)
+            return
+        self.view.update_status("Photo processed successfully.")
+        if session.button["name"] == "Animated GIF":
+            # self.view.show_animation(assembled_photo_path)
+            pass
+        else:
+            self.suspend_preview = True
+            self.view.show_image(archive_path)
+        session.review_hold = Deadline(constants.REVIEW_HOLD_MILLIS)
+        session.schedule(session.review_hold.remaining_ms(), self._session_review_due, session)
+
+    def _session_review_due(self, session):
+        """Publish the photo once the review has been on screen long enough."""
+        if session.review_hold.expired():
+            self._session_publish(session)
+        else:
+            # Woken up early, wait for the rest of the hold
+            session.schedule(session.review_hold.remaining_ms(), self._session_review_due,
+                             session)
+
+    def _session_publish(self, session):
+        """Upload the archived photo in the background and get ready for the next guest."""
+        session.enter(STATE_PUBLISH)
+        if not self._view_taken(session):
+            self.view.update_status("Uploading photo...")
+            # Show an information image while processing the photos
+            self.view.show_image(os.path.join(constants.RESOURCES_FOLDER, "uploading.png"))
+
+        # Use background thread for upload to prevent UI blocking
+        self._async_upload_and_archive(session.archive_path)
+        self._session_end(session, "Ready")
+
+    def _session_end(self, session, message=None, level=logging.INFO):
+        """End the session, then restart the preview and show the buttons if idle."""
+        if message:
+            self.log.log(level, message)
+        view_taken = self._view_taken(session)
+        session.finish()
+        self._cleanup_session(session)
+        if view_taken:
+            # Another session owns the view
+            return
+        if message:
+            self.view.update_status(message)
+        # Restart the preview; the producer restarts the camera off the UI thread
+        self.suspend_preview = False
+        self.preview_producer.resume()
+        if self._room_for_session():
+            self.view.show_buttons()
+
+    def _session_error(self, session, error):
+        """End a session whose step raised an exception."""
+        if session.state == STATE_CAPTURE:
+            self.camera.end_session()
+        self._session_end(session, f"Photo session failed: {error}", logging.ERROR)
+
+    def _take_burst(self, session, number_of_photos, ms_between_photos):
+        """Take all the photos of a session as one burst in a worker thread."""
+        self.view.update_status("Taking photos...")
+        self.thread_pool.submit(self._burst_task, session, number_of_photos, ms_between_photos)
+
+    def _burst_task(self, session, number_of_photos, ms_between_photos):
+        """Capture the burst off the UI thread and pass the frames to the UI thread."""
+        try:
+            status = self.camera.capture_burst(number_of_photos, ms_between_photos,
+                                               profile=session.button["name"])
+        except Exception as e: # pylint: disable=W0718
+            self.log.error("Burst for %s failed: %s", session.button["name"], e)
+            status = {"success": False, "pil_images": [], "jitter_ms": None,
+                      "message": f"Burst failed: {e}"}
+        session.schedule(0, self._session_burst_taken, session, status, number_of_photos)
+
+    def _session_burst_taken(self, session, status, number_of_photos):
+        """Add the frames of the burst to the session, then end the capture."""
+        button = session.button
+        if status["jitter_ms"] is not None:
+            self.log.info("Burst for %s: %s, max inter-frame jitter %.1f ms",
+                          button["name"], status["message"], status["jitter_ms"])
+        for pil_image in status["pil_images"]:
+            self._add_frame(session, pil_image)
+            shot_file = self._shot_path(session, session.shots)
+            if shot_file:
+                self.pending_encodes[shot_file] = self.encoder.submit(pil_image, shot_file)
+                session.photos.append(shot_file)
+        if status["pil_images"]:
+            self._show_still_preview(status["pil_images"][-1])
+        self.view.update_status(f"{session.shots} of {number_of_photos} photos taken.")
+        self._session_end_capture(session)
+
+    def _add_frame(self, session, pil_image):
+        """Hand a captured shot to the session's collage, or keep it for assembly."""
+        if session.collage is not None:
+            if session.shots < session.collage.tile_count:
+                if session.shots == 0:
+                    # Timestamped with the first shot, not with the button click
+                    session.collage.exif = self.camera.exif_bytes()
+                session.collage.add(session.shots, pil_image)
+                if session.review is not None:
+                    session.review.add(session.shots, pil_image)
+        else:
+            session.frames.append(pil_image)
+        session.shots += 1
+        session.last_shot_ns = time.monotonic_ns()
+
+    def _shot_path(self, session, index):
+        """Return the archive path of a session's shot, None unless shots are archived."""
+        if not self.configuration.archive_individual_shots:
+            return None
+        os.makedirs(constants.ARCHIVE_FOLDER, exist_ok=True)
+        return os.path.join(constants.ARCHIVE_FOLDER, f"photo_{session.session_id}_{index}.jpg")
+
+    def _cleanup_session(self, session):
+        """Remove the session folder in the background once its photos are written."""
+        pending = [photo for photo in session.photos if photo in self.pending_encodes]
+        futures = [self.pending_encodes.pop(photo) for photo in pending]
+        # A session that failed or was aborted before assembly still owns its collage
+        collage, session.collage = session.collage, None
+
+        def cleanup_task():
+            if collage is not None:
+                collage.abort()
+            for photo, status in zip(pending, self.encoder.wait(futures)):
+                if not status["success"]:
+                    self.log.warning("Failed to save photo %s: %s", photo, status["message"])
+            self.storage.release(session.work_dir)
+            self.log.debug("Removed session folder %s", session.work_dir)
+
+        self.thread_pool.submit(cleanup_task)
+
+    def _leftover_files(self):
+        """Return the files and folders currently in the working folders."""
+        return [os.path.join(folder, filename) for folder in self.storage.folders()
+                if os.path.exists(folder) for filename in os.listdir(folder)]
+
+    def _delete_temp_files(self, paths=None):
+        """Removes paths, all files from the working folders if None.
+
+        At startup the paths are listed by _leftover_files before any session
+        allocates a folder, so the background removal cannot touch a session's files.
+        """
+        if paths is None:
+            paths = self._leftover_files()
+        removed = 0
+        for file_path in paths:
             try:
-                os.remove(file_path)
-                print(f"Removed: {file_path}")
+                if os.path.isdir(file_path):
+                    self.storage.release(file_path)
+                else:
+                    os.remove(file_path)
+                removed += 1
             except OSError as e:
-                print(f"Error removing {file_path}: {e}")
+                self.log.warning("Error removing %s: %s", file_path, e)
+        if removed:
+            self.log.info("Removed %d leftover files and folders from the working folders",
+                          removed)
 
     def handle_button_click(self, button):
         """Handle button click events."""
@@ -301,73 +719,8 @@ class BoothController:
         # Show the countdown overlay if button is for taking a photo
         if button["name"] in ["Single Photo", "Four Square", "Nine Square",
                               "Animated GIF"]:
-            self.view.hide_buttons()
-            photos = self._countdown_and_take_photos(button)
-            # Stop the camera after taking photos
-            # If the camera remains active, the camera buffer may fill up
-            # and cause the camera to stop working.
-            self.camera.stop_camera()
-
-            if not photos or len(photos) == 0:
-                self.view.update_status("No photos taken.")
-                self.log.warning("No photos taken.")
-                self.view.show_buttons()
-                self.view.suspend_poll = False
-                return
-
-            self.view.update_status("Photo(s) taken successfully.")
-            # Show an information image while processing the photos
-            self.view.show_image(os.path.join(constants.RESOURCES_FOLDER, "processing.png"))
-            assembled_image = None
-            if button["name"] == "Animated GIF":
-                # Assemble the animation from the photos taken
-                assembled_image = self._assemble_animation(button, photos)
-            else:
-                # Assemble the photo from the photos taken
-                assembled_image = self._assemble_collage(button, photos)
-
-            if assembled_image is None:
-                self.view.update_status("Failed to assemble the photo.")
-                self.log.warning("Failed to assemble the photo.")
-                self.view.show_buttons()
-                self.view.suspend_poll = False
-                return
-
-            # Archive the final assembled image
-            photo_filename = f"photo_{time.strftime('%Y%m%d_%H%M%S')}"
-            if button["name"] == "Animated GIF":
-                photo_filename += ".gif"
-            else:
-                photo_filename += ".jpg"
-
-            if not os.path.exists(constants.ARCHIVE_FOLDER):
-                os.makedirs(constants.ARCHIVE_FOLDER)
-            self.last_photo_path = os.path.join(constants.ARCHIVE_FOLDER, photo_filename)
-            self.log.info("Archiving final photo to %s", self.last_photo_path)
-            shutil.copy2(assembled_image, self.last_photo_path)
-
-            self.view.update_status("Photo processed successfully.")
-
-            if button["name"] == "Animated GIF":
-                # self.view.show_animation(assembled_photo_path)
-                pass
-            else:
-                self.view.show_image(self.last_photo_path)
-            current_millis = helpers.millis()
-            while helpers.millis() - current_millis < 3000:
-                self.view.update()
-
-            self.view.update_status("Uploading photo...")
-            # Show an information image while processing the photos
-            self.view.show_image(os.path.join(constants.RESOURCES_FOLDER, "uploading.png"))
-
-            # Use background thread for upload to prevent UI blocking
-            self._async_upload_and_archive(self.last_photo_path)
-
-            # Update UI on main thread immediately for better responsiveness
-            self.update_preview_image()
-            self.view.show_buttons()
-            self.view.update_status("Ready")
+            # The session runs from view.after() callbacks, this returns right away
+            self._start_session(button)
 
         if button["name"] == "Print Photo":
             # self.model.print_photo()
@@ -443,10 +796,18 @@ class BoothController:
     def _finalize_before_shutdown(self):
         """Cleanup resources on shutdown."""
         self.view.suspend_poll = True
+        for session in self.sessions:
+            session.cancel()
+        self.preview_producer.stop()
+        if self.gps is not None:
+            self.gps.stop()
         self.camera.stop_camera()
 
         # Clean up thread pool
         self.thread_pool.shutdown(wait=False)
+        self.assembly_pool.shutdown(wait=True)
+        self.collage_pool.shutdown(wait=True)
+        self.encoder.shutdown(wait=True)
 
         time.sleep(1)
         self._delete_temp_files()
@@ -509,39 +870,39 @@ class BoothController:
         # Resume polling after handling the event
         self.view.suspend_poll = False
 
-    def take_photo_save_to_file(self, filepath, width=None, height=None):
-        """Take a photo and save it to a file."""
-        if not filepath:
-            self.view.update_status("No file path provided for saving photo.")
-            return False
+    def take_session_photo(self, width=None, height=None, deadline_ns=None, profile=None,
+                           filepath=None):
+        """Take a photo, show it in the preview and return the image, or None on failure.
 
+        If filepath is given the photo is also saved to it in the background.
+        """
         self.log.info("Taking photo with width=%s, height=%s to %s",
                          width, height, filepath)
-        status_take_photo = self.camera.take_photo(False, width, height)
+        status_take_photo = self.camera.take_photo(False, width, height, deadline_ns, profile)
 
         if not status_take_photo["success"] or status_take_photo["pil_image"] is None:
             self.view.update_status(status_take_photo["message"])
-            return False
+            return None
 
         # If the photo was taken successfully, show in preview
         self.view.update_status("Photo taken successfully.")
-        preview_image = status_take_photo["pil_image"].transpose(Image.FLIP_LEFT_RIGHT)
-        preview_image.thumbnail((self.camera.preview_width, self.camera.preview_height))
-        if preview_image is None:
-            self.view.update_status("Failed to create preview image.")
-            self.log.warning("Failed to create preview image.")
-            print("Failed to create preview image.")
-        else:
-            # Update the preview image in the view
-            self.view.update_preview_image(preview_image)
-        # If the photo was taken successfully, save it to a file
-        status_save_photo = self.camera.save_image(status_take_photo["pil_image"], filepath)
-
-        if not status_save_photo["success"]:
-            self.view.update_status(status_save_photo["message"])
-            return False
-
-        return True
+        self._show_still_preview(status_take_photo["pil_image"])
+        if filepath:
+            # Encode it to a file in the background
+            self.pending_encodes[filepath] = self.encoder.submit(status_take_photo["pil_image"],
+                                                                 filepath)
+
+        return status_take_photo["pil_image"]
+
+    def _show_still_preview(self, pil_image):
+        """Show a mirrored thumbnail of a still in the preview."""
+        # Shrink the still by a whole factor first, the full size image is never
+        # copied, then fit and mirror the small image
+        size = (self.camera.preview_width, self.camera.preview_height)
+        factor = max(1, min(pil_image.width // size[0], pil_image.height // size[1]))
+        preview_image = pil_image.reduce(factor) if factor > 1 else pil_image
+        preview_image = ImageOps.contain(preview_image, size, Image.BILINEAR)
+        self.view.update_preview_image(preview_image.transpose(Image.FLIP_LEFT_RIGHT))
 
     def snap_photo(self, preview=False, width=None, height=None):
         """Take a photo and return the image."""
@@ -558,15 +919,17 @@ class BoothController:
         return status["pil_image"]
 
     def update_preview_image(self):
-        """Update the preview image in the view."""
-        # Update the preview image if not suspended
-        status = self.camera.take_photo(True)
+        """Update the preview image in the view with the newest captured frame."""
+        status = self.preview_producer.slot.take()
+        if status is None:
+            # No new frame since the last update
+            return
 
-        if not status["success"] or status["pil_image"] is None:
+        if not status["success"] or status["frame"] is None:
             self.view.update_status(status["message"])
         else:
-            # If the preview image was updated successfully, update the view
-            self.view.update_preview_image(status["pil_image"])
+            # If the preview frame was captured successfully, update the view
+            self.view.update_preview_frame(status["frame"])
 
     def update_preview_image_fast(self):
         """Update the preview image with reduced resolution for better performance."""
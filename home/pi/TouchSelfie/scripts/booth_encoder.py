@@ -0,0 +1,60 @@
+"""Background JPEG encoding for captured stills.
+
+Captured images are handed to a small pool of worker threads that encode and
+write them, so the capture loop can move straight on to the next shot. Pillow
+releases the GIL while encoding, so threads encode in parallel without having
+to copy full resolution frames into other processes.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class PhotoEncoder:
+    """Bounded pool encoding PIL images to files."""
+
+    def __init__(self, save_image, max_workers: int = 2, max_pending: int = 4):
+        """Create the pool.
+
+        Arguments:
+            save_image -- callable(pil_image, filepath) returning a status dict,
+                          e.g. BoothCamera.save_image
+            max_workers -- number of encoder threads
+            max_pending -- images queued or being encoded before submit() blocks,
+                           bounding the memory held by captured frames
+        """
+        self.logger = logging.getLogger(__name__)
+        self.save_image = save_image
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="PhotoEncoder")
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, pil_image, filepath: str, **kwargs):
+        """Queue an image to be written to filepath and return its Future.
+
+        The Future's result is the status dict of save_image. kwargs are passed
+        to save_image.
+        """
+        self._slots.acquire()  # pylint: disable=R1732
+        try:
+            future = self._executor.submit(self.save_image, pil_image, filepath, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def wait(self, futures):
+        """Wait for futures from submit() and return the list of their status dicts."""
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:  # pylint: disable=W0718
+                self.logger.error("Error encoding photo: %s", e)
+                results.append({"success": False, "message": f"Error encoding photo: {e}"})
+        return results
+
+    def shutdown(self, wait: bool = True):
+        """Stop the pool, waiting for queued images by default."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,105 @@
+"""Zero shutter lag pre-capture buffer for the photobooth.
+
+While the camera runs, every full resolution frame is copied into a ring of
+preallocated arrays together with its sensor timestamp. When a photo is due the
+frame closest to the deadline is returned, so the photo matches the moment the
+countdown ended rather than the moment the capture call got around to running.
+A frame more than about one frame interval from the deadline is not returned,
+e.g. when the buffer went stale while the preview was paused, the caller then
+captures a live frame.
+"""
+
+import logging
+import threading
+
+import numpy as np # type: ignore # pylint: disable=E0401
+
+class FrameRingBuffer:
+    """Ring of preallocated frames indexed by sensor timestamp (nanoseconds)."""
+
+    def __init__(self, shape, depth: int = 4, memory_budget_mb: int = 128):
+        """Allocate up to depth frames of shape (height, width, channels).
+
+        The depth is reduced so that the buffer fits in memory_budget_mb.
+        """
+        self.logger = logging.getLogger(__name__)
+        frame_bytes = int(np.prod(shape))
+        max_depth = (memory_budget_mb * 1024 * 1024) // frame_bytes
+        if max_depth < depth:
+            self.logger.warning("Pre-capture depth reduced from %d to %d frames to fit %d MB",
+                                depth, max_depth, memory_budget_mb)
+            depth = max_depth
+        self.depth = depth
+        self.shape = tuple(shape)
+        self._lock = threading.Lock()
+        self._frames = np.empty((depth,) + self.shape, dtype=np.uint8)
+        self._timestamps = np.zeros(depth, dtype=np.int64)
+        self._count = 0  # Number of frames written since the last clear
+        self.logger.info("Pre-capture buffer of %d frames %s (%.1f MB)",
+                         depth, self.shape, self._frames.nbytes / (1024 * 1024))
+
+    @property
+    def enabled(self):
+        """True if the buffer can hold at least one frame."""
+        return self.depth > 0
+
+    def write(self, frame, timestamp_ns: int):
+        """Copy a frame into the oldest slot."""
+        if not self.enabled or frame.shape != self.shape:
+            return False
+        with self._lock:
+            index = self._count % self.depth
+            np.copyto(self._frames[index], frame)
+            self._timestamps[index] = timestamp_ns
+            self._count += 1
+        return True
+
+    def frame_interval_ns(self):
+        """Return the median interval between the buffered frames, None with fewer than two."""
+        with self._lock:
+            filled = min(self._count, self.depth)
+            if filled < 2:
+                return None
+            return int(np.median(np.diff(np.sort(self._timestamps[:filled]))))
+
+    def closest(self, timestamp_ns: int, max_distance_ns: int = None):
+        """Return a copy of the frame closest to timestamp_ns and its timestamp.
+
+        max_distance_ns -- farthest a frame may be from timestamp_ns, one frame
+                           interval (plus a quarter for jitter) if None
+        Returns (None, None) if the buffer is empty or no frame is close enough.
+        """
+        if max_distance_ns is None:
+            interval_ns = self.frame_interval_ns()
+            if interval_ns is None:
+                return None, None
+            max_distance_ns = interval_ns + interval_ns // 4
+        with self._lock:
+            filled = min(self._count, self.depth)
+            if filled == 0:
+                return None, None
+            distances = np.abs(self._timestamps[:filled] - timestamp_ns)
+            index = int(np.argmin(distances))
+            if distances[index] > max_distance_ns:
+                return None, None
+            return self._frames[index].copy(), int(self._timestamps[index])
+
+    def clear(self):
+        """Forget all buffered frames, e.g. after the camera was restarted."""
+        with self._lock:
+            self._count = 0
+
+
+if __name__ == "__main__":
+    # Frames every 33 ms, the buffer only answers for deadlines near them
+    ring = FrameRingBuffer((4, 4, 3), depth=4)
+    for number in range(6):
+        ring.write(np.full((4, 4, 3), number, dtype=np.uint8), number * 33_000_000)
+    assert ring.frame_interval_ns() == 33_000_000
+    buffered, timestamp = ring.closest(140_000_000)
+    assert timestamp == 132_000_000 and buffered[0, 0, 0] == 4
+    assert ring.closest(500_000_000) == (None, None)
+    assert ring.closest(500_000_000, max_distance_ns=400_000_000)[1] == 165_000_000
+    ring.clear()
+    assert ring.closest(0) == (None, None)
+    print("Stale and empty buffers fall back to a live capture")
@@ -0,0 +1,223 @@
+"""In-process gpsd client for the photobooth.
+
+GpsdClient keeps a connection to gpsd on a background thread and holds the
+latest position fix in memory, so EXIF generation reads the location without
+any I/O. gpsd's JSON TPV reports are used; raw NMEA GGA/RMC sentences are also
+understood. FakeGpsd replays recorded JSON or NMEA lines on a local socket to
+test the client without a receiver.
+"""
+
+import json
+import time
+import socket
+import logging
+import threading
+
+WATCH_COMMAND = b'?WATCH={"enable":true,"json":true};\n'
+
+def _nmea_coordinate(value: str, hemisphere: str):
+    """Convert an NMEA ddmm.mmmm / dddmm.mmmm value to signed decimal degrees."""
+    if not value or not hemisphere:
+        return None
+    degrees_length = value.index(".") - 2
+    degrees = float(value[:degrees_length]) + float(value[degrees_length:]) / 60
+    return -degrees if hemisphere in ("S", "W") else degrees
+
+def parse_nmea(sentence: str):
+    """Return (lat, lon) from a GGA or RMC sentence with a valid fix, else None."""
+    fields = sentence.split("*")[0].split(",")
+    try:
+        if fields[0].endswith("GGA") and len(fields) > 6 and fields[6] not in ("", "0"):
+            lat = _nmea_coordinate(fields[2], fields[3])
+            lon = _nmea_coordinate(fields[4], fields[5])
+        elif fields[0].endswith("RMC") and len(fields) > 6 and fields[2] == "A":
+            lat = _nmea_coordinate(fields[3], fields[4])
+            lon = _nmea_coordinate(fields[5], fields[6])
+        else:
+            return None
+    except ValueError:
+        return None
+    if lat is None or lon is None:
+        return None
+    return lat, lon
+
+def parse_gpsd_json(line: str):
+    """Return (lat, lon) from a gpsd TPV report with a 2D/3D fix, else None."""
+    try:
+        report = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(report, dict):
+        return None
+    if report.get("class") != "TPV" or report.get("mode", 0) < 2:
+        return None
+    try:
+        return float(report["lat"]), float(report["lon"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class GpsdClient(threading.Thread):
+    """Background gpsd client caching the latest position fix."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 2947, max_fix_age: float = 60.0,
+                 fallback=None, clock=time.monotonic):
+        """Create the client, call start() to connect.
+
+        Arguments:
+            host, port -- gpsd address
+            max_fix_age -- seconds after which a fix is considered stale
+            fallback -- (lat, lon) returned when there is no fresh fix, or None
+            clock -- monotonic clock used to age fixes
+        """
+        super().__init__(name="GpsdClient", daemon=True)
+        self.logger = logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.max_fix_age = max_fix_age
+        self.fallback = fallback
+        self.clock = clock
+        # Replaced as a whole so readers never see a half updated fix
+        self._fix = None  # (lat, lon, received)
+        self._stopped = threading.Event()
+        self._socket = None
+
+    def position(self):
+        """Return the (lat, lon) of the latest fresh fix, the fallback otherwise."""
+        fix = self._fix
+        if fix is None or self.clock() - fix[2] > self.max_fix_age:
+            return self.fallback
+        return fix[0], fix[1]
+
+    @property
+    def has_fix(self):
+        """True if the latest fix is not stale."""
+        fix = self._fix
+        return fix is not None and self.clock() - fix[2] <= self.max_fix_age
+
+    def handle_line(self, line: str):
+        """Update the fix from one line of gpsd output (JSON or NMEA)."""
+        line = line.strip()
+        if line.startswith("{"):
+            position = parse_gpsd_json(line)
+        elif line.startswith("$"):
+            position = parse_nmea(line)
+        else:
+            position = None
+        if position is not None:
+            if self._fix is None:
+                self.logger.info("GPS fix acquired: %.6f, %.6f", *position)
+            self._fix = (position[0], position[1], self.clock())
+        return position
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the client."""
+        self._stopped.set()
+        sock = self._socket
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        """Read gpsd reports until stopped, reconnecting with a back-off."""
+        retry_delay = 1.0
+        while not self._stopped.is_set():
+            try:
+                with socket.create_connection((self.host, self.port), timeout=5) as sock:
+                    self._socket = sock
+                    sock.settimeout(None)
+                    sock.sendall(WATCH_COMMAND)
+                    self.logger.info("Connected to gpsd at %s:%d", self.host, self.port)
+                    retry_delay = 1.0
+                    with sock.makefile("r", encoding="ascii", errors="replace") as reader:
+                        for line in reader:
+                            if self._stopped.is_set():
+                                break
+                            self.handle_line(line)
+            except OSError as e:
+                if not self._stopped.is_set():
+                    self.logger.warning("gpsd connection to %s:%d failed: %s",
+                                        self.host, self.port, e)
+            finally:
+                self._socket = None
+            self._stopped.wait(retry_delay)
+            retry_delay = min(retry_delay * 2, 60.0)
+
+
+class FakeGpsd(threading.Thread):
+    """Local server replaying gpsd JSON or NMEA lines to each client."""
+
+    def __init__(self, lines, host: str = "127.0.0.1", port: int = 0, interval: float = 0.1):
+        """Create the server, port 0 picks a free port (see self.port)."""
+        super().__init__(name="FakeGpsd", daemon=True)
+        self.lines = list(lines)
+        self.interval = interval
+        self._server = socket.create_server((host, port))
+        self.host, self.port = self._server.getsockname()[:2]
+        self._stopped = threading.Event()
+
+    def run(self):
+        """Accept clients and replay the lines in a loop."""
+        self._server.settimeout(0.2)
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._replay, args=(client,), daemon=True).start()
+
+    def _replay(self, client):
+        """Send the lines to one client until it disconnects."""
+        with client:
+            try:
+                client.recv(1024)  # ?WATCH command
+                while not self._stopped.is_set():
+                    for line in self.lines:
+                        client.sendall(line.encode("ascii") + b"\n")
+                        if self._stopped.wait(self.interval):
+                            return
+            except OSError:
+                return
+
+    def stop(self):
+        """Stop the server."""
+        self._stopped.set()
+        self._server.close()
+
+
+if __name__ == "__main__":
+    # Replay a session of gpsd output, then age the fix with a fake clock
+    replayed = [
+        '{"class":"VERSION","release":"3.24"}',
+        '{"class":"TPV","mode":1}',
+        "$GPGGA,123519,4148.000,N,07547.000,W,1,08,0.9,545.4,M,46.9,M,,*47",
+        '{"class":"TPV","mode":3,"lat":41.8,"lon":-75.8}',
+    ]
+    now = [1000.0]
+    static = (48.8584, 2.2945)
+    fake = FakeGpsd(replayed, interval=0.02)
+    fake.start()
+    gps = GpsdClient(fake.host, fake.port, max_fix_age=5, fallback=static,
+                     clock=lambda: now[0])
+    gps.start()
+    wait_until = time.monotonic() + 5
+    while not gps.has_fix and time.monotonic() < wait_until:
+        time.sleep(0.05)
+    gps.stop()
+    fake.stop()
+
+    fresh = gps.position()
+    assert gps.has_fix and abs(fresh[0] - 41.8) < 1e-6 and abs(fresh[1] + 75.8) < 0.02, fresh
+    for ignored in replayed[:2] + ["[1, 2]", "42", '{"class":"TPV","mode":3,"lat":"north"}',
+                                  '{"class":"TPV","mode":2,"lat":null,"lon":2.0}']:
+        assert gps.handle_line(ignored) is None, ignored
+        assert gps.position() == fresh, ignored
+    now[0] += 5.5
+    assert not gps.has_fix and gps.position() == static
+    print(f"Fix {fresh} while fresh, fallback {static} once stale")
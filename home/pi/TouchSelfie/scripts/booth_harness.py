@@ -0,0 +1,232 @@
+"""Headless harness for driving the photobooth without a camera or a display.
+
+BoothController runs with a SimulatedBackend camera and a HeadlessView, so whole
+photo sessions, from countdown to upload, can be run and timed on any Linux box.
+
+Usage:
+    python booth_harness.py [button name] [sessions]
+    python booth_harness.py soak [cycles]
+"""
+
+import os
+import sys
+import time
+import heapq
+import itertools
+import tempfile
+import threading
+import functools
+import tracemalloc
+
+import constants
+from booth_camera import BoothCamera, STRATEGY_DUAL_STREAM
+from camera_backends import SimulatedBackend
+
+class HeadlessView:
+    """Stand-in for BoothView implementing the methods used by BoothController."""
+
+    poll_interval = 50
+
+    def __init__(self, controller, countdown_steps: int = 0,
+                 screen_width: int = 800, screen_height: int = 480):
+        """Create the view, countdown_steps is the number of countdown images shown."""
+        self.controller = controller
+        self.countdown_steps = countdown_steps
+        self.countdown_index = -1
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.suspend_poll = False
+        self.status = ""
+        self.frames_shown = 0
+        self.buttons_visible = True
+        # Scheduled callbacks as (due time, id, callback, args), like Tk's timer queue
+        self._events = []
+        self._cancelled = set()
+        self._ids = itertools.count()
+        self._events_changed = threading.Condition()
+        self.after(self.poll_interval, self.run_poll)
+
+    def main(self):
+        """Nothing to run, sessions are driven by the harness."""
+
+    def update(self):
+        """No events to process."""
+
+    def update_idletasks(self):
+        """Nothing to draw."""
+
+    def after(self, ms, func=None, *args):
+        """Schedule func(*args) in ms milliseconds, or sleep if there is no func."""
+        if func is None:
+            time.sleep(ms / 1000)
+            return None
+        with self._events_changed:
+            after_id = next(self._ids)
+            heapq.heappush(self._events, (time.monotonic() + ms / 1000, after_id, func, args))
+            self._events_changed.notify()
+        return after_id
+
+    def after_cancel(self, after_id):
+        """Cancel a callback scheduled with after()."""
+        with self._events_changed:
+            self._cancelled.add(after_id)
+
+    def run_until(self, predicate, timeout: float = 60.0):
+        """Run scheduled callbacks until predicate() is true, False on timeout."""
+        timeout_at = time.monotonic() + timeout
+        while not predicate():
+            with self._events_changed:
+                while True:
+                    now = time.monotonic()
+                    if now >= timeout_at:
+                        return False
+                    if self._events and self._events[0][0] <= now:
+                        _, after_id, func, args = heapq.heappop(self._events)
+                        break
+                    wait = timeout_at - now
+                    if self._events:
+                        wait = min(wait, self._events[0][0] - now)
+                    self._events_changed.wait(wait)
+            if after_id in self._cancelled:
+                self._cancelled.discard(after_id)
+                continue
+            func(*args)
+        return True
+
+    def run_poll(self):
+        """Poll the controller like BoothView.run_poll()."""
+        if not self.suspend_poll:
+            self.controller.handle_poll_timer()
+        self.after(self.poll_interval, self.run_poll)
+
+    def quit(self):
+        """Nothing to quit."""
+
+    def destroy(self):
+        """Nothing to destroy."""
+
+    def hide_buttons(self):
+        """Mark the buttons hidden."""
+        self.buttons_visible = False
+
+    def show_buttons(self):
+        """Mark the buttons visible, a guest may start a session."""
+        self.buttons_visible = True
+
+    def show_countdown(self, countdown_index=None):
+        """Count down countdown_steps steps, return False when done."""
+        if countdown_index is None:
+            self.countdown_index -= 1
+        else:
+            self.countdown_index = min(countdown_index, self.countdown_steps - 1)
+        return self.countdown_index >= 0
+
+    def show_image(self, filename):  # pylint: disable=W0613
+        """Count the image as shown."""
+        self.frames_shown += 1
+
+    def update_preview_image(self, image):  # pylint: disable=W0613
+        """Count the image as shown."""
+        self.frames_shown += 1
+
+    def update_preview_frame(self, frame):  # pylint: disable=W0613
+        """Count the frame as shown."""
+        self.frames_shown += 1
+
+    def update_status(self, message="", level="info"):  # pylint: disable=W0613
+        """Keep the last status message."""
+        self.status = message
+
+
+def run_sessions(button_name: str = "Four Square", sessions: int = 5,
+                 countdown_steps: int = 0, **backend_kwargs):
+    """Run photo sessions through BoothController and return the session times in seconds.
+
+    A session's time runs from its button click until the buttons are shown again
+    and the next guest can click. With constants.SESSIONS_IN_FLIGHT above one that
+    is before the session's photo is assembled. Each session's state timings are
+    logged by the controller.
+
+    The temp, working storage and archive folders are redirected to a temporary
+    directory.
+    backend_kwargs are passed to SimulatedBackend (sensor_resolution, frame_rate,
+    latency).
+    """
+    # Imported here so the camera tools above do not need the controller's dependencies
+    from booth_controller import BoothController # pylint: disable=C0415
+
+    button = next(b for b in constants.BUTTONS if b["name"] == button_name)
+    with tempfile.TemporaryDirectory() as work_dir:
+        constants.TEMP_FOLDER = os.path.join(work_dir, "Temp")
+        constants.ARCHIVE_FOLDER = os.path.join(work_dir, "Photos")
+        constants.WORKING_STORAGE_FOLDER = os.path.join(work_dir, "Ram")
+        os.makedirs(constants.TEMP_FOLDER)
+
+        controller = BoothController(
+            backend=SimulatedBackend(**backend_kwargs),
+            view_class=functools.partial(HeadlessView, countdown_steps=countdown_steps))
+        durations = []
+        try:
+            view = controller.view
+            for _ in range(sessions):
+                start = time.perf_counter()
+                controller.handle_button_click(button)
+                if not view.run_until(lambda: view.buttons_visible):
+                    raise RuntimeError(f"Session did not finish: {view.status}")
+                durations.append(time.perf_counter() - start)
+            if not view.run_until(lambda: not any(s.active for s in controller.sessions)):
+                raise RuntimeError(f"Sessions did not finish: {view.status}")
+        finally:
+            controller.preview_producer.stop()
+            controller.thread_pool.shutdown(wait=True)
+    return durations
+
+
+def soak_test(cycles: int = 2000, max_growth_mb: float = 1.0):
+    """Run preview/still/end-of-session cycles on a kept running BoothCamera.
+
+    Raises AssertionError if camera requests leak or the traced memory grows by
+    more than max_growth_mb between the end of the warm-up (the first tenth of
+    the cycles) and the last session. Raises ValueError if cycles is below 1.
+    """
+    if cycles < 1:
+        raise ValueError(f"The soak test needs at least 1 cycle, not {cycles}")
+    warm_up = max(1, cycles // 10)
+    camera = BoothCamera(strategy=STRATEGY_DUAL_STREAM, keep_running=True,
+                         backend=SimulatedBackend(sensor_resolution=(640, 480),
+                                                  frame_rate=1000.0))
+    assert camera.camera_started, "Simulated camera did not start"
+
+    tracemalloc.start()
+    baseline = None
+    for cycle in range(cycles):
+        for _ in range(3):
+            assert camera.take_preview_frame()["success"]
+        assert camera.take_photo(False, 320, 240)["success"]
+        assert camera.end_session()["success"]
+        if cycle == warm_up - 1:
+            baseline, _ = tracemalloc.get_traced_memory()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    growth_mb = (current - baseline) / (1024 * 1024)
+    buffer_count = camera.dual_stream_config["buffer_count"]
+    assert camera.recycler.peak_outstanding <= buffer_count, "Too many requests held"
+    assert growth_mb <= max_growth_mb, f"Memory grew by {growth_mb:.2f} MB"
+    return {"captures": camera.recycler.captures,
+            "peak_outstanding": camera.recycler.peak_outstanding,
+            "growth_mb": growth_mb, "peak_mb": peak / (1024 * 1024)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "soak":
+        results = soak_test(int(sys.argv[2]) if len(sys.argv) > 2 else 2000)
+        print(f"Soak: {results['captures']} captures, " +
+              f"{results['peak_outstanding']} requests held at most, " +
+              f"memory grew {results['growth_mb']:.2f} MB, peak {results['peak_mb']:.1f} MB")
+        sys.exit(0)
+    name = sys.argv[1] if len(sys.argv) > 1 else "Four Square"
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    times = run_sessions(name, count)
+    print(f"{name}: {len(times)} sessions, mean {sum(times) / len(times):.2f} s, " +
+          f"{len(times) / sum(times) * 60:.1f} sessions/min")
@@ -0,0 +1,133 @@
+"""Band by band JPEG writing with Pillow.
+
+Pillow encodes a JPEG from a complete image, so a collage normally has to exist
+as one full size canvas before it can be saved. With a restart marker after
+every row of MCUs, horizontal bands whose heights are multiples of the MCU
+height encode independently: the DC predictors reset at each marker and the
+quantisation and Huffman tables only depend on the quality. BandJpegWriter
+encodes each band on its own, renumbers its restart markers and appends its
+scan data to one file, so only a band has to be in memory at a time.
+"""
+
+import io
+import os
+import re
+import logging
+
+from PIL import Image # type: ignore # pylint: disable=E0401
+
+MCU_HEIGHT = 16  # Rows per MCU with the default 4:2:0 chroma subsampling
+_RESTART_MARKER = re.compile(rb"\xff[\xd0-\xd7]")
+_supported = None
+
+def _split_jpeg(data: bytes):
+    """Return the header before SOS, the SOS segment and the scan data of a JPEG."""
+    if data[:2] != b"\xff\xd8" or data[-2:] != b"\xff\xd9":
+        raise ValueError("Not a complete JPEG")
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError(f"Bad JPEG marker at {pos}")
+        marker = data[pos + 1]
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        if marker == 0xDA:
+            sos_end = pos + 2 + length
+            return data[:pos], data[pos:sos_end], data[sos_end:-2]
+        pos += 2 + length
+    raise ValueError("No scan in JPEG")
+
+
+def _set_height(header: bytes, height: int):
+    """Return the JPEG header with the frame height set to height."""
+    pos = 2
+    while pos + 4 <= len(header):
+        marker = header[pos + 1]
+        length = int.from_bytes(header[pos + 2:pos + 4], "big")
+        if marker in (0xC0, 0xC1):
+            return header[:pos + 5] + height.to_bytes(2, "big") + header[pos + 7:]
+        pos += 2 + length
+    raise ValueError("No baseline frame header in JPEG")
+
+
+def _encode(band, quality: int, exif: bytes = None):
+    """Encode a band as a JPEG with a restart marker after every MCU row."""
+    buffer = io.BytesIO()
+    kwargs = {"quality": quality, "subsampling": "4:2:0", "restart_marker_rows": 1}
+    if exif:
+        kwargs["exif"] = exif
+    band.save(buffer, "JPEG", **kwargs)
+    return buffer.getvalue()
+
+
+def bands_supported():
+    """True if this Pillow writes JPEG restart markers, needed to join bands."""
+    global _supported # pylint: disable=W0603
+    if _supported is None:
+        try:
+            data = _encode(Image.new("RGB", (16, 2 * MCU_HEIGHT)), 75)
+            _supported = b"\xff\xdd" in _split_jpeg(data)[0]
+        except Exception: # pylint: disable=W0718
+            _supported = False
+        if not _supported:
+            logging.getLogger(__name__).info("JPEG restart markers not supported, " +
+                                             "collages are encoded in one piece")
+    return _supported
+
+
+class BandJpegWriter:
+    """Write a JPEG of size (width, height) from horizontal RGB bands, top to bottom."""
+
+    def __init__(self, path: str, size: tuple, quality: int = 75, exif: bytes = None):
+        """Open path for writing, exif is the EXIF block for the file."""
+        self.path = path
+        self.width, self.height = size
+        self.quality = quality
+        self.exif = exif
+        self.rows_written = 0
+        self._restart_index = 0
+        self._file = open(path, "wb") # pylint: disable=R1732
+
+    def write(self, band):
+        """Append band (RGB, full width), its height must be a multiple of MCU_HEIGHT
+        unless it is the last band."""
+        if band.width != self.width:
+            raise ValueError(f"Band is {band.width} wide, the image {self.width}")
+        if self.rows_written % MCU_HEIGHT:
+            raise ValueError("Only the last band may end inside an MCU row")
+        if self.rows_written + band.height > self.height:
+            raise ValueError("Band extends below the image")
+
+        header, sos, scan = _split_jpeg(_encode(band, self.quality,
+                                                self.exif if self.rows_written == 0 else None))
+        if self.rows_written == 0:
+            self._file.write(_set_height(header, self.height))
+            self._file.write(sos)
+        else:
+            # Bands are separated by a restart marker as well
+            self._file.write(bytes((0xFF, 0xD0 + self._restart_index % 8)))
+            self._restart_index += 1
+        self._file.write(_RESTART_MARKER.sub(self._next_marker, scan))
+        self.rows_written += band.height
+
+    def _next_marker(self, _match):
+        """Return the next restart marker in the file's sequence."""
+        marker = bytes((0xFF, 0xD0 + self._restart_index % 8))
+        self._restart_index += 1
+        return marker
+
+    def close(self):
+        """Finish the file, raising ValueError if bands are missing."""
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"{self.rows_written} of {self.height} rows written")
+            self._file.write(b"\xff\xd9")
+        finally:
+            self._file.close()
+
+    def abort(self):
+        """Close and remove the unfinished file."""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,264 @@
+"""Collage layouts of the photobooth buttons.
+
+The "layout" entry of a button in constants.BUTTONS describes where its shots
+go in the assembled photo:
+
+    {"type": "grid", "columns": 2, "rows": 3}    columns x rows full size shots
+    {"type": "strip"}                             the shots in one column
+    {"type": "strip", "direction": "horizontal"}  the shots in one row
+    {"type": "hero"}                              the first shot at full size,
+                                                  the others as thumbnails below
+
+Every type also takes "spacing" and "margin" in pixels, the "background" RGB
+colour around the shots and "overlay", the area the foreground image is scaled
+to: "canvas" (default) or "photos", the box around the shots without the
+margin. Buttons without a layout get a square grid if their photo count is a
+perfect square.
+
+A Layout is computed once per definition, shot size and photo count and cached.
+Thumbnails are a whole fraction of the shot size so they are scaled with
+Image.reduce, and the slots covered by each band of rows and the geometry of
+the screen sized review are kept, so a session does no geometry of its own.
+"""
+
+import math
+import threading
+
+from PIL import Image # type: ignore # pylint: disable=E0401
+
+LAYOUT_GRID = "grid"
+LAYOUT_STRIP = "strip"
+LAYOUT_HERO = "hero"
+LAYOUT_TYPES = (LAYOUT_GRID, LAYOUT_STRIP, LAYOUT_HERO)
+
+_cache = {}  # (definition, shot size, photo count) -> Layout
+_lock = threading.Lock()
+
+class Layout:
+    """Precomputed geometry of a collage: canvas size, slots, scale factors and overlay box."""
+
+    def __init__(self, shot_size: tuple, placements, size: tuple,
+                 background: tuple = (255, 255, 255), overlay: str = "canvas"):
+        """Place shots of shot_size (width, height) on a canvas of size.
+
+        placements -- (x, y, reduction) of each shot in shot order, the shot is
+                      scaled down by the whole factor reduction
+        overlay -- "canvas" or "photos", the area covered by the foreground image
+        """
+        self.shot_size = tuple(shot_size)
+        self.size = tuple(size)
+        self.background = tuple(background)
+        self.reductions = tuple(reduction for _, _, reduction in placements)
+        # Image.reduce rounds the size up
+        self.slots = tuple((x, y, -(-self.shot_size[0] // reduction),
+                            -(-self.shot_size[1] // reduction))
+                           for x, y, reduction in placements)
+        for x, y, width, height in self.slots:
+            if x < 0 or y < 0 or x + width > self.size[0] or y + height > self.size[1]:
+                raise ValueError(f"Slot {width}x{height} at ({x}, {y}) outside the " +
+                                 f"{self.size[0]}x{self.size[1]} collage")
+        if overlay == "canvas":
+            self.overlay_box = (0, 0) + self.size
+        elif overlay == "photos":
+            left = min(x for x, _, _, _ in self.slots)
+            top = min(y for _, y, _, _ in self.slots)
+            self.overlay_box = (left, top,
+                                max(x + width for x, _, width, _ in self.slots) - left,
+                                max(y + height for _, y, _, height in self.slots) - top)
+        else:
+            raise ValueError(f"Unknown overlay area: {overlay}")
+        self._bands = {}  # Band height -> ((top, bottom, slot indices), ...)
+        self._scaled = {}  # Maximum size -> (size, slots, overlay box)
+
+    @property
+    def width(self):
+        """Width of the collage."""
+        return self.size[0]
+
+    @property
+    def height(self):
+        """Height of the collage."""
+        return self.size[1]
+
+    @property
+    def tile_count(self):
+        """Number of shots in the collage."""
+        return len(self.slots)
+
+    @property
+    def overlay_size(self):
+        """Size the foreground image is scaled to."""
+        return self.overlay_box[2:]
+
+    def bands(self, band_height: int):
+        """Return (top, bottom, indices of the slots crossing the rows) per band of rows."""
+        bands = self._bands.get(band_height)
+        if bands is None:
+            bands = []
+            for top in range(0, self.height, band_height):
+                bottom = min(top + band_height, self.height)
+                bands.append((top, bottom, tuple(
+                    index for index, (_, y, _, height) in enumerate(self.slots)
+                    if y < bottom and y + height > top)))
+            bands = self._bands[band_height] = tuple(bands)
+        return bands
+
+    def scaled(self, max_size: tuple):
+        """Return the geometry of the layout shrunk to fit max_size (width, height).
+
+        Returns (size, slots, overlay box), each slot is (x, y, width, height,
+        reduction): a shot reduced by the whole factor reduction is at least as
+        large as the slot.
+        """
+        geometry = self._scaled.get(tuple(max_size))
+        if geometry is None:
+            scale = min(max_size[0] / self.width, max_size[1] / self.height, 1.0)
+
+            def box(x, y, width, height):
+                left, top = round(x * scale), round(y * scale)
+                return (left, top, max(1, round((x + width) * scale) - left),
+                        max(1, round((y + height) * scale) - top))
+
+            slots = []
+            for slot in self.slots:
+                x, y, width, height = box(*slot)
+                slots.append((x, y, width, height,
+                              max(1, min(self.shot_size[0] // width,
+                                         self.shot_size[1] // height))))
+            geometry = self._scaled[tuple(max_size)] = (
+                (max(1, round(self.width * scale)), max(1, round(self.height * scale))),
+                tuple(slots), box(*self.overlay_box))
+        return geometry
+
+    def fit(self, index: int, tile):
+        """Return tile (a PIL image of the shot size) scaled to slot index."""
+        size = self.slots[index][2:]
+        if tile.size == size:
+            return tile
+        if tile.size == self.shot_size:
+            return tile.reduce(self.reductions[index])
+        return tile.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+
+def _grid(shot_size, columns, rows, spacing, margin):
+    """Return the placements and the canvas size of a grid of full size shots."""
+    width, height = shot_size
+    placements = [(margin + column * (width + spacing), margin + row * (height + spacing), 1)
+                  for row in range(rows) for column in range(columns)]
+    return placements, (2 * margin + columns * width + (columns - 1) * spacing,
+                        2 * margin + rows * height + (rows - 1) * spacing)
+
+
+def _hero(shot_size, photo_count, spacing, margin):
+    """Return the placements and the canvas size of a hero shot above a row of thumbnails."""
+    width, height = shot_size
+    thumbnails = photo_count - 1
+    if thumbnails == 0:
+        return [(margin, margin, 1)], (2 * margin + width, 2 * margin + height)
+
+    # Smallest whole reduction whose thumbnails fit under the hero shot
+    reduction = max(2, thumbnails)
+    while thumbnails * -(-width // reduction) + (thumbnails - 1) * spacing > width:
+        reduction += 1
+    thumb_width = -(-width // reduction)
+    thumb_height = -(-height // reduction)
+    left = margin + (width - thumbnails * thumb_width - (thumbnails - 1) * spacing) // 2
+    top = margin + height + spacing
+    placements = [(margin, margin, 1)]
+    placements += [(left + index * (thumb_width + spacing), top, reduction)
+                   for index in range(thumbnails)]
+    return placements, (2 * margin + width, top + thumb_height + margin)
+
+
+def compute_layout(definition: dict, shot_size: tuple, photo_count: int):
+    """Return the Layout of definition for photo_count shots of shot_size.
+
+    Raises ValueError if the definition is not valid for photo_count shots.
+    """
+    layout_type = definition.get("type", LAYOUT_GRID)
+    spacing = int(definition.get("spacing", 0))
+    margin = int(definition.get("margin", 0))
+    if photo_count < 1 or spacing < 0 or margin < 0:
+        raise ValueError(f"Invalid {layout_type} layout of {photo_count} photos")
+
+    if layout_type == LAYOUT_HERO:
+        placements, size = _hero(shot_size, photo_count, spacing, margin)
+    elif layout_type in (LAYOUT_GRID, LAYOUT_STRIP):
+        if layout_type == LAYOUT_STRIP:
+            direction = definition.get("direction", "vertical")
+            if direction not in ("vertical", "horizontal"):
+                raise ValueError(f"Unknown strip direction: {direction}")
+            columns, rows = (1, photo_count) if direction == "vertical" else (photo_count, 1)
+        else:
+            columns = int(definition.get("columns", 0))
+            rows = int(definition.get("rows", 0))
+        if columns * rows != photo_count:
+            raise ValueError(f"A {columns}x{rows} grid does not hold {photo_count} photos")
+        placements, size = _grid(shot_size, columns, rows, spacing, margin)
+    else:
+        raise ValueError(f"Unknown layout type: {layout_type}")
+    return Layout(shot_size, placements, size,
+                  background=definition.get("background", (255, 255, 255)),
+                  overlay=definition.get("overlay", "canvas"))
+
+
+def _freeze(value):
+    """Return value with its dicts and lists made hashable."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def layout_for(button: dict, shot_size: tuple = None):
+    """Return the cached Layout of a photo button, None if it has no collage layout.
+
+    shot_size -- size of the shots the camera delivers, which can differ from the
+                 button's photo_size once the camera aligned it; photo_size if None
+    Raises ValueError if the button's layout definition is not valid.
+    """
+    if "photo_size" not in button:
+        return None
+    shot_size = tuple(shot_size or button["photo_size"])
+    photo_count = button.get("photo_count", 1)
+    definition = button.get("layout")
+    if definition is None:
+        side = math.isqrt(photo_count)
+        if side * side != photo_count:
+            return None
+        definition = {"type": LAYOUT_GRID, "columns": side, "rows": side}
+    key = (_freeze(definition), shot_size, photo_count)
+    with _lock:
+        layout = _cache.get(key)
+        if layout is None:
+            layout = _cache[key] = compute_layout(definition, shot_size, photo_count)
+        return layout
+
+
+if __name__ == "__main__":
+    # Geometry checks of the layout types
+    shot = (1093, 821)
+    grid = layout_for({"photo_size": shot, "photo_count": 6,
+                       "layout": {"type": "grid", "columns": 2, "rows": 3}})
+    assert grid.size == (2186, 2463) and grid.slots[5] == (1093, 1642, 1093, 821)
+    assert grid is layout_for({"photo_size": shot, "photo_count": 6,
+                               "layout": {"rows": 3, "columns": 2, "type": "grid"}})
+    strip = layout_for({"photo_size": shot, "photo_count": 4,
+                        "layout": {"type": "strip", "spacing": 20, "margin": 40}})
+    assert strip.size == (1173, 4 * 821 + 3 * 20 + 80)
+    hero = layout_for({"photo_size": (3280, 2464), "photo_count": 4,
+                       "layout": {"type": "hero", "spacing": 16, "margin": 40,
+                                  "overlay": "photos"}})
+    assert hero.reductions == (1, 4, 4, 4) and hero.slots[1] == (434, 2520, 820, 616)
+    assert hero.overlay_box == (40, 40, 3280, 2464 + 16 + 616)
+    assert layout_for({"photo_size": shot, "photo_count": 10}) is None
+    for checked in (grid, strip, hero):
+        covered = {index for _, _, indices in checked.bands(256) for index in indices}
+        assert covered == set(range(checked.tile_count))
+        assert checked.fit(1, Image.new("RGB", checked.shot_size)).size == checked.slots[1][2:]
+        review_size, review_slots, _ = checked.scaled((800, 480))
+        assert review_size[0] <= 800 and review_size[1] <= 480
+        assert all(-(-checked.shot_size[0] // reduction) >= width
+                   for _, _, width, _, reduction in review_slots)
+        print(f"{checked.tile_count} slots in {checked.width}x{checked.height}: {checked.slots}")
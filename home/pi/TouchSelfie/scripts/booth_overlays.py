@@ -0,0 +1,157 @@
+"""Cache of foreground overlays scaled to the size of the collages they cover.
+
+Opening an overlay PNG and resizing it to a full resolution collage with
+LANCZOS is one of the slowest steps of assembling a photo. OverlayCache keeps
+the scaled overlays keyed by file path, modification time and size, so each
+is prepared once (at startup, in the background) and reloaded only when the
+logo file changes.
+
+The logo frames are mostly transparent, so a PreparedOverlay keeps only the
+boxes that contain visible pixels, premultiplied by their alpha, and blends
+them onto an RGB collage without converting the whole collage to RGBA.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np # type: ignore # pylint: disable=E0401
+from PIL import Image # type: ignore # pylint: disable=E0401
+
+class PreparedOverlay:
+    """RGBA overlay reduced to its visible boxes, ready to blend onto RGB images."""
+
+    def __init__(self, overlay, block: int = 32):
+        """Prepare an RGBA PIL image, visible pixels are found in block x block squares."""
+        self.size = overlay.size
+        rgba = np.asarray(overlay.convert("RGBA"))
+        self.boxes = []  # (x0, y0, x1, y1, premultiplied RGB, 255 - alpha, opaque)
+        for x0, y0, x1, y1 in self._visible_boxes(rgba[..., 3], block):
+            region = rgba[y0:y1, x0:x1]
+            alpha = region[..., 3:4].astype(np.uint16)
+            premultiplied = region[..., :3].astype(np.uint16) * alpha + 127
+            self.boxes.append((x0, y0, x1, y1, premultiplied, 255 - alpha,
+                               bool((alpha == 255).all())))
+
+    @staticmethod
+    def _visible_boxes(alpha, block):
+        """Return boxes covering the non-transparent pixels, runs of blocks per block row."""
+        height, width = alpha.shape
+        rows = -(-height // block)
+        columns = -(-width // block)
+        padded = np.zeros((rows * block, columns * block), dtype=bool)
+        padded[:height, :width] = alpha > 0
+        visible = padded.reshape(rows, block, columns, block).any(axis=(1, 3))
+
+        boxes = []
+        for row in range(rows):
+            # Start and end of each run of visible blocks in this row
+            edges = np.diff(np.concatenate(([0], visible[row].astype(np.int8), [0])))
+            for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                boxes.append((start * block, row * block,
+                              min(end * block, width), min((row + 1) * block, height)))
+        return boxes
+
+    @property
+    def coverage(self):
+        """Fraction of the overlay area inside the visible boxes."""
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1, *_ in self.boxes)
+        return area / (self.size[0] * self.size[1])
+
+    def composite(self, image, origin: tuple = (0, 0)):
+        """Blend the overlay onto image (RGB PIL image) in place.
+
+        image covers the part of the overlay starting at origin (x, y), e.g. a band
+        of the collage. Parts of the image outside the overlay are left as they are.
+        """
+        left, top = origin
+        right, bottom = left + image.width, top + image.height
+        for x0, y0, x1, y1, premultiplied, inverse_alpha, opaque in self.boxes:
+            # Part of the box inside the image
+            cx0, cy0, cx1, cy1 = max(x0, left), max(y0, top), min(x1, right), min(y1, bottom)
+            if cx0 >= cx1 or cy0 >= cy1:
+                continue
+            rows = slice(cy0 - y0, cy1 - y0)
+            columns = slice(cx0 - x0, cx1 - x0)
+            box = (cx0 - left, cy0 - top, cx1 - left, cy1 - top)
+            if opaque:
+                blended = (premultiplied[rows, columns] // 255).astype(np.uint8)
+            else:
+                region = np.asarray(image.crop(box), dtype=np.uint16)
+                blended = ((premultiplied[rows, columns] +
+                            region * inverse_alpha[rows, columns]) // 255).astype(np.uint8)
+            image.paste(Image.fromarray(blended, "RGB"), box[:2])
+        return image
+
+
+class OverlayCache:
+    """Scaled PreparedOverlays keyed by (path, mtime, size)."""
+
+    def __init__(self, max_entries: int = 8):
+        """Create an empty cache holding at most max_entries overlays."""
+        self.log = logging.getLogger(__name__)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (path, mtime_ns, size) -> PreparedOverlay
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(path: str, size: tuple):
+        """Return the cache key of path at size, None if the file does not exist."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        return (os.path.abspath(path), mtime_ns, tuple(size))
+
+    def get(self, path: str, size: tuple):
+        """Return the overlay at path scaled to size (width, height), None if missing."""
+        key = self._key(path, size)
+        if key is None:
+            return None
+        with self._lock:
+            overlay = self._entries.get(key)
+            if overlay is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return overlay
+
+            # Loaded with the lock held so a session and a background prepare
+            # of the same overlay do not both resize it
+            self.misses += 1
+            self._drop(key[0], key[2])
+            try:
+                with Image.open(path) as image:
+                    overlay = PreparedOverlay(image.convert("RGBA").resize(key[2],
+                                                                           Image.LANCZOS))
+            except Exception as e: # pylint: disable=W0718
+                self.log.error("Failed to load overlay %s: %s", path, e)
+                return None
+            self._entries[key] = overlay
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.log.info("Prepared overlay %s at %dx%d, %.0f%% of it visible", path,
+                          key[2][0], key[2][1], overlay.coverage * 100)
+            return overlay
+
+    def _drop(self, path: str, size: tuple):
+        """Remove the entries of path at size, from older versions of the file."""
+        for key in [key for key in self._entries if key[0] == path and key[2] == size]:
+            del self._entries[key]
+
+    def prepare(self, overlays):
+        """Load and scale the (path, size) pairs in overlays that are not cached yet."""
+        for path, size in overlays:
+            self.get(path, size)
+
+    def invalidate(self, path: str = None):
+        """Forget the overlays of path, or all overlays if path is None."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            path = os.path.abspath(path)
+            for key in [key for key in self._entries if key[0] == path]:
+                del self._entries[key]
@@ -0,0 +1,191 @@
+"""Preview frame producer for the photobooth.
+
+The preview is captured on a dedicated thread so a slow sensor never blocks the
+Tk event loop. Frames are handed to the UI through a single slot that only keeps
+the newest frame, older frames that were not displayed in time are dropped.
+"""
+
+import time
+import logging
+import threading
+import tkinter as tk
+
+import numpy as np # type: ignore # pylint: disable=E0401
+
+class LatestFrameSlot:
+    """Single slot buffer holding the most recent preview frame."""
+
+    def __init__(self):
+        """Initialize an empty slot."""
+        self._lock = threading.Lock()
+        self._frame = None
+        self.sequence = 0  # Incremented for every frame put in the slot
+        self.dropped = 0  # Frames replaced before they were taken
+
+    def put(self, frame):
+        """Store a frame, replacing the previous one."""
+        with self._lock:
+            if self._frame is not None:
+                self.dropped += 1
+            self._frame = frame
+            self.sequence += 1
+
+    def take(self):
+        """Return the newest frame and empty the slot, None if there is no new frame."""
+        with self._lock:
+            frame = self._frame
+            self._frame = None
+            return frame
+
+    def clear(self):
+        """Drop the frame held in the slot."""
+        with self._lock:
+            self._frame = None
+
+
+class PreviewProducer(threading.Thread):
+    """Thread continuously capturing preview frames into a LatestFrameSlot."""
+
+    def __init__(self, camera, slot: LatestFrameSlot = None, max_fps: float = 30.0):
+        """Create the producer for a BoothCamera, call start() to begin capturing."""
+        super().__init__(name="PreviewProducer", daemon=True)
+        self.logger = logging.getLogger(__name__)
+        self.camera = camera
+        self.slot = slot if slot is not None else LatestFrameSlot()
+        self.min_interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self._running = threading.Event()
+        self._running.set()
+        self._stopped = threading.Event()
+        self._idle = threading.Event()  # Set while no capture is in progress
+
+    def pause(self, wait: bool = True):
+        """Stop capturing preview frames, optionally waiting for the current capture."""
+        self._running.clear()
+        if wait and self.is_alive():
+            self._idle.wait()
+        self.slot.clear()
+
+    def resume(self):
+        """Resume capturing preview frames."""
+        self._running.set()
+
+    @property
+    def paused(self):
+        """True if the producer is paused."""
+        return not self._running.is_set()
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the producer thread."""
+        self._stopped.set()
+        self._running.set()  # Wake the thread if paused
+        if self.is_alive():
+            self.join(timeout)
+
+    def run(self):
+        """Capture preview frames until stopped."""
+        self.logger.info("Preview producer started")
+        while not self._stopped.is_set():
+            self._idle.set()
+            self._running.wait()
+            if self._stopped.is_set():
+                break
+            self._idle.clear()
+            # Re-check after flagging busy, pause() may have been called in between
+            if not self._running.is_set():
+                continue
+
+            frame_start = time.monotonic()
+            try:
+                status = self.camera.take_preview_frame()
+            except Exception as e:  # pylint: disable=W0718
+                self.logger.error("Error capturing preview frame: %s", e)
+                status = {"success": False, "frame": None,
+                          "message": f"Error capturing preview frame: {e}"}
+            self.slot.put(status)
+
+            elapsed = time.monotonic() - frame_start
+            if not status["success"]:
+                # Avoid spinning on a camera that is failing
+                time.sleep(0.5)
+            elif elapsed < self.min_interval:
+                time.sleep(self.min_interval - elapsed)
+        self._idle.set()
+        self.logger.info("Preview producer stopped")
+
+
+class PreviewRenderer:
+    """Render RGB numpy frames into one persistent Tk PhotoImage.
+
+    Each frame is copied once into a reused PPM buffer which Tk decodes in place
+    into the same PhotoImage, avoiding the PIL image and the new ImageTk.PhotoImage
+    allocated for every frame.
+    """
+
+    def __init__(self, master=None):
+        """Create the renderer, the PhotoImage is created with the first frame."""
+        self.master = master
+        self.photo = None
+        self._buffer = None
+        self._pixels = None
+        self._shape = None
+
+    def _allocate(self, height: int, width: int):
+        """Allocate the PPM buffer (header followed by the pixels) for a frame size."""
+        header = f"P6 {width} {height} 255 ".encode("ascii")
+        self._buffer = np.empty(len(header) + width * height * 3, dtype=np.uint8)
+        self._buffer[:len(header)] = np.frombuffer(header, dtype=np.uint8)
+        self._pixels = self._buffer[len(header):].reshape(height, width, 3)
+        self._shape = (height, width)
+
+    def render(self, frame):
+        """Update the PhotoImage from an RGB (height, width, 3) uint8 array."""
+        height, width = frame.shape[:2]
+        if self._shape != (height, width):
+            self._allocate(height, width)
+        # Tk only accepts bytes, the buffer is reused so this is the only allocation
+        np.copyto(self._pixels, frame[..., :3])
+        data = self._buffer.tobytes()
+        if self.photo is None:
+            self.photo = tk.PhotoImage(master=self.master, data=data, format="PPM")
+        else:
+            self.photo.configure(data=data, format="PPM")
+        return self.photo
+
+
+def benchmark(frame_count: int = 200):
+    """Compare preview frames/s of the PIL path against the PreviewRenderer."""
+    from PIL import Image, ImageTk # type: ignore # pylint: disable=E0401,C0415
+
+    root = tk.Tk()
+    sizes = [(640, 480), (root.winfo_screenwidth(), root.winfo_screenheight())]
+    canvas = tk.Canvas(root, width=sizes[1][0], height=sizes[1][1])
+    canvas.pack()
+    item = canvas.create_image(0, 0, anchor="nw")
+    rng = np.random.default_rng(0)
+
+    for width, height in sizes:
+        # Mirrored views, as produced by the dual stream preview
+        frames = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8)[:, ::-1]
+                  for _ in range(4)]
+
+        start = time.perf_counter()
+        for i in range(frame_count):
+            tkimage = ImageTk.PhotoImage(Image.fromarray(np.ascontiguousarray(frames[i % 4])))
+            canvas.itemconfig(item, image=tkimage)
+            root.update()
+        pil_fps = frame_count / (time.perf_counter() - start)
+
+        renderer = PreviewRenderer(root)
+        start = time.perf_counter()
+        for i in range(frame_count):
+            canvas.itemconfig(item, image=renderer.render(frames[i % 4]))
+            root.update()
+        renderer_fps = frame_count / (time.perf_counter() - start)
+
+        print(f"{width}x{height}: PIL + ImageTk {pil_fps:.1f} frames/s, " +
+              f"PreviewRenderer {renderer_fps:.1f} frames/s")
+    root.destroy()
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,125 @@
+"""Photo session state machine for the photobooth.
+
+A session moves through the states idle, countdown, capture, assemble, review
+and publish. Every wait between two steps is a view.after() callback, so the UI
+thread sleeps in the Tk event loop instead of spinning in view.update() loops.
+The wall clock and process CPU time spent in each state are kept so sessions can
+be compared.
+"""
+
+import math
+import time
+import uuid
+import logging
+
+STATE_IDLE = "idle"
+STATE_COUNTDOWN = "countdown"
+STATE_CAPTURE = "capture"
+STATE_ASSEMBLE = "assemble"
+STATE_REVIEW = "review"
+STATE_PUBLISH = "publish"
+STATES = (STATE_IDLE, STATE_COUNTDOWN, STATE_CAPTURE, STATE_ASSEMBLE, STATE_REVIEW,
+          STATE_PUBLISH)
+
+class PhotoSession:
+    """State, photos and timing of one photo session.
+
+    The controller implements the steps and moves the session between states,
+    the session schedules the steps on the view and measures each state.
+    """
+
+    def __init__(self, button: dict, view, on_error=None, work_dir: str = None):
+        """Create an idle session for button.
+
+        view -- object with Tk's after() and after_cancel()
+        on_error -- called with the session and the exception when a step raises
+        work_dir -- folder for the photos and the assembled image of this session
+        """
+        self.log = logging.getLogger(__name__)
+        # Sortable and unique, also when the clock is set back by GPS
+        self.session_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.button = button
+        self.view = view
+        self.on_error = on_error
+        self.work_dir = work_dir
+        self.state = STATE_IDLE
+        self.shots = 0  # Number of shots taken
+        self.frames = []  # Captured images in shot order, unless handed to collage
+        self.photos = []  # Files the shots are saved to, if they are archived
+        self.collage = None  # CollageBuilder filled as the shots are taken
+        self.review = None  # ReviewBuilder of the collage shown for review
+        self.review_shown_ns = None  # Monotonic time the review was shown
+        self.archive_path = None  # Archived photo of the session
+        self.last_shot_ns = None  # Monotonic time of the last shot
+        self.assembled_image = None
+        self.countdown_timer = None
+        self.snap_timer = None
+        self.review_hold = None  # Deadline of the review on screen
+        self.metrics = {}  # State name -> {"wall_ms", "cpu_ms"}
+        self._entered_ns = None  # (monotonic, process CPU) when the state was entered
+        self._after_id = None
+
+    @property
+    def active(self):
+        """True between the start and the end of the session."""
+        return self.state != STATE_IDLE
+
+    def enter(self, state: str):
+        """Move to state, recording the time spent in the previous one."""
+        if state not in STATES:
+            raise ValueError(f"Unknown session state: {state}")
+        now = (time.monotonic_ns(), time.process_time_ns())
+        if self.state != STATE_IDLE and self._entered_ns is not None:
+            self.metrics[self.state] = {
+                "wall_ms": (now[0] - self._entered_ns[0]) / 1_000_000,
+                "cpu_ms": (now[1] - self._entered_ns[1]) / 1_000_000
+            }
+        self.log.debug("Session %s: %s -> %s", self.session_id, self.state, state)
+        self.state = state
+        self._entered_ns = now
+
+    def schedule(self, delay_ms: float, func, *args):
+        """Run func(*args) on the view after delay_ms, replacing any pending step.
+
+        Worker threads use schedule(0, ...) to hand a step back to the UI thread.
+        """
+        self.cancel()
+        self._after_id = self.view.after(max(0, math.ceil(delay_ms)), self._run_step,
+                                         func, args)
+
+    def cancel(self):
+        """Cancel the pending step, if any."""
+        if self._after_id is not None:
+            self.view.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _run_step(self, func, args):
+        """Run a scheduled step, reporting exceptions to on_error."""
+        self._after_id = None
+        try:
+            func(*args)
+        except Exception as e: # pylint: disable=W0718
+            self.log.error("Session %s failed in state %s: %s",
+                           self.session_id, self.state, e)
+            if self.on_error is not None:
+                self.on_error(self, e)
+
+    def finish(self):
+        """End the session and log the time spent in each state."""
+        self.cancel()
+        self.enter(STATE_IDLE)
+        self.log.info("Session %s (%s): %s", self.session_id, self.button["name"],
+                      self.summary())
+
+    def summary(self):
+        """Return the wall clock and CPU time of each state as text."""
+        parts = []
+        for state in STATES:
+            if state in self.metrics:
+                wall_ms = self.metrics[state]["wall_ms"]
+                cpu_ms = self.metrics[state]["cpu_ms"]
+                load = cpu_ms / wall_ms * 100 if wall_ms > 0 else 0.0
+                parts.append(f"{state} {wall_ms:.0f} ms (CPU {cpu_ms:.0f} ms, {load:.0f}%)")
+        total_ms = sum(m["wall_ms"] for m in self.metrics.values())
+        parts.append(f"total {total_ms:.0f} ms")
+        return ", ".join(parts)
@@ -0,0 +1,99 @@
+"""Working storage for the files of photo sessions.
+
+Intermediate files (photo tiles, assembled images before archiving) are only
+needed for the length of a session. WorkingStorage places each session's folder
+in a RAM backed folder such as /dev/shm when it fits within a size budget and
+the system has memory to spare, and falls back to the disk folder otherwise, so
+the SD card only receives the final archived photos.
+"""
+
+import os
+import shutil
+import logging
+import threading
+
+def available_memory_mb():
+    """Return the memory available to new allocations in MB, or None if unknown."""
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class WorkingStorage:
+    """Allocate session folders in RAM within a budget, on disk otherwise."""
+
+    def __init__(self, ram_folder: str, disk_folder: str, budget_mb: float = 256,
+                 min_free_memory_mb: float = 128):
+        """Create the storage.
+
+        ram_folder -- folder on a tmpfs (e.g. /dev/shm/TouchSelfie), None or "" for disk only
+        disk_folder -- fallback folder on disk
+        budget_mb -- maximum size of the session folders kept in ram_folder
+        min_free_memory_mb -- memory that must stay available after a session is placed in RAM
+        """
+        self.log = logging.getLogger(__name__)
+        self.ram_folder = ram_folder or None
+        self.disk_folder = disk_folder
+        self.budget_mb = budget_mb
+        self.min_free_memory_mb = min_free_memory_mb
+        self._reserved = {}  # RAM session folder -> reserved MB
+        self._lock = threading.Lock()
+
+        if self.ram_folder is not None:
+            try:
+                os.makedirs(self.ram_folder, exist_ok=True)
+            except OSError as e:
+                self.log.warning("RAM working storage %s not available, using %s: %s",
+                                 self.ram_folder, self.disk_folder, e)
+                self.ram_folder = None
+
+    def folders(self):
+        """Return the folders session folders are created in."""
+        if self.ram_folder is None:
+            return [self.disk_folder]
+        return [self.ram_folder, self.disk_folder]
+
+    def reserved_mb(self):
+        """Return the MB reserved by the session folders in RAM."""
+        with self._lock:
+            return sum(self._reserved.values())
+
+    def _fits_in_ram(self, size_mb: float):
+        """True if size_mb more fits in the budget, in the RAM folder and in free memory."""
+        if self.ram_folder is None:
+            return False
+        if sum(self._reserved.values()) + size_mb > self.budget_mb:
+            return False
+        try:
+            stat = os.statvfs(self.ram_folder)
+            if stat.f_bavail * stat.f_frsize / (1024 * 1024) < size_mb:
+                return False
+        except OSError:
+            return False
+        memory_mb = available_memory_mb()
+        return memory_mb is None or memory_mb - size_mb >= self.min_free_memory_mb
+
+    def allocate(self, name: str, size_mb: float):
+        """Create and return the folder for a session expected to write size_mb."""
+        with self._lock:
+            in_ram = self._fits_in_ram(size_mb)
+            path = os.path.join(self.ram_folder if in_ram else self.disk_folder, name)
+            if in_ram:
+                self._reserved[path] = size_mb
+        if not in_ram and self.ram_folder is not None:
+            self.log.info("%s (%.0f MB) does not fit in RAM working storage " +
+                          "(%.0f of %.0f MB reserved), using %s", name, size_mb,
+                          self.reserved_mb(), self.budget_mb, self.disk_folder)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def release(self, path: str):
+        """Remove a session folder and return its RAM reservation."""
+        shutil.rmtree(path, ignore_errors=True)
+        with self._lock:
+            self._reserved.pop(path, None)
@@ -0,0 +1,83 @@
+"""Monotonic deadline timers for the photobooth.
+
+The GPS services resynchronise the wall clock while the booth runs, so timing
+based on time.time() can jump or stall. These timers use time.monotonic_ns(),
+which only moves forward at a steady rate. The clock can be injected for
+testing.
+"""
+
+import time
+
+class Deadline:
+    """A point in time a duration after creation (or restart)."""
+
+    def __init__(self, duration_ms: float, clock=time.monotonic_ns):
+        """Create a deadline duration_ms from now, clock returns nanoseconds."""
+        self.clock = clock
+        self.duration_ns = int(duration_ms * 1_000_000)
+        self.deadline_ns = clock() + self.duration_ns
+
+    def restart(self):
+        """Move the deadline to duration_ms from now."""
+        self.deadline_ns = self.clock() + self.duration_ns
+
+    def expired(self):
+        """True once the deadline has been reached."""
+        return self.clock() >= self.deadline_ns
+
+    def remaining_ms(self):
+        """Milliseconds left before the deadline, 0 if expired."""
+        return max(0, self.deadline_ns - self.clock()) / 1_000_000
+
+
+class PeriodicTimer:
+    """Timer due once per period on a fixed schedule.
+
+    Deadlines are start + n * period, so the cadence does not drift with the
+    time spent handling each tick. Ticks missed while the caller was busy are
+    skipped rather than fired in a rush.
+    """
+
+    def __init__(self, period_ms: float, clock=time.monotonic_ns, immediate: bool = False):
+        """Create the timer, the first tick is one period from now (or now if immediate)."""
+        self.clock = clock
+        self.period_ns = max(1, int(period_ms * 1_000_000))
+        self.next_deadline_ns = clock() + (0 if immediate else self.period_ns)
+        self.last_deadline_ns = None  # Scheduled time of the last tick
+        self.skipped = 0
+
+    def due(self):
+        """Return True, once, when the next tick is reached."""
+        now = self.clock()
+        if now < self.next_deadline_ns:
+            return False
+        missed = (now - self.next_deadline_ns) // self.period_ns
+        self.skipped += missed
+        # The latest tick reached, not the first one missed
+        self.last_deadline_ns = self.next_deadline_ns + missed * self.period_ns
+        self.next_deadline_ns = self.last_deadline_ns + self.period_ns
+        return True
+
+    def remaining_ms(self):
+        """Milliseconds left before the next tick, 0 if due."""
+        return max(0, self.next_deadline_ns - self.clock()) / 1_000_000
+
+
+if __name__ == "__main__":
+    # Self check with an injected clock that stalls and jumps forward
+    fake_now = [0]
+    def fake_clock():
+        """Fake monotonic clock in nanoseconds."""
+        return fake_now[0]
+
+    ticks = PeriodicTimer(1000, clock=fake_clock)
+    hold = Deadline(3000, clock=fake_clock)
+    assert not ticks.due() and not hold.expired()
+    fake_now[0] = 999_000_000
+    assert not ticks.due()
+    fake_now[0] = 1_000_000_000
+    assert ticks.due() and not ticks.due()
+    fake_now[0] = 4_500_000_000  # Jump forward by several periods
+    assert ticks.due() and ticks.skipped == 2 and hold.expired()
+    assert ticks.last_deadline_ns == 4_000_000_000 and ticks.remaining_ms() == 500
+    print("booth_timing self check passed")
@@ -10,6 +10,7 @@ from tkinter import Canvas, messagebox  # pylint: disable=W0611
 from PIL import Image, ImageTk, ImageSequence # type: ignore # pylint: disable=E0401
 
 import constants
+from booth_preview import PreviewRenderer
 
 class BoothView(tk.Tk):
     """View class for managing the booth application."""
@@ -47,6 +48,7 @@ class BoothView(tk.Tk):
 
         self._make_buttons()
         self.preview_tkimage = None  # Initialize attribute to avoid linter error
+        self.preview_renderer = PreviewRenderer(self)
         self._make_preview_image()
         self.show_buttons()
 
@@ -376,6 +378,14 @@ class BoothView(tk.Tk):
         self.canvas.itemconfig(self.preview_image, image=self.preview_tkimage)
         self.canvas.update()
 
+    def update_preview_frame(self, frame):
+        """Update the preview image on the canvas from an RGB numpy array."""
+        photo = self.preview_renderer.render(frame)
+        # Point the canvas back to the persistent image if show_image replaced it
+        if self.preview_tkimage is not photo:
+            self.preview_tkimage = photo
+            self.canvas.itemconfig(self.preview_image, image=self.preview_tkimage)
+
     def update_status(self, message="", level="info"):
         """Update the status label with a message and level."""
         if hasattr(self, "status_label"):
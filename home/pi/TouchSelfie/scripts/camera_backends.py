@@ -0,0 +1,365 @@
+"""Camera backends for the photobooth.
+
+BoothCamera talks to the camera through a CameraBackend. Picamera2Backend drives
+the Raspberry Pi camera; SimulatedBackend produces synthetic frames at a
+configurable resolution, frame rate and latency so the capture pipeline can be
+benchmarked and load-tested on any Linux machine.
+"""
+
+import time
+import threading
+import contextlib
+
+import numpy as np # type: ignore # pylint: disable=E0401
+
+BACKEND_PICAMERA2 = "picamera2"
+BACKEND_SIMULATED = "simulated"
+
+class CameraBackend:
+    """Interface of the camera used by BoothCamera (a subset of Picamera2)."""
+
+    sensor_resolution = (2592, 1944)
+    revision = "Camera Module"
+    # Sensor modes as reported by Picamera2: dicts with "size", "bit_depth", "fps"
+    # and "crop_limits" (x, y, width, height)
+    sensor_modes = []
+
+    def __init__(self):
+        """Initialize the backend."""
+        self.options = {}
+
+    def transform(self, hflip: bool = False, vflip: bool = False):
+        """Return the transform to pass to a configuration."""
+        return {"hflip": hflip, "vflip": vflip}
+
+    def create_preview_configuration(self, main=None, lores=None, buffer_count=4, **kwargs):
+        """Return a preview configuration."""
+        raise NotImplementedError
+
+    def create_still_configuration(self, main=None, lores=None, buffer_count=1, **kwargs):
+        """Return a still configuration."""
+        raise NotImplementedError
+
+    def align_configuration(self, config):
+        """Align the stream sizes of a configuration in place."""
+        raise NotImplementedError
+
+    def configure(self, config):
+        """Configure the camera, it must be stopped."""
+        raise NotImplementedError
+
+    def start(self):
+        """Start the camera."""
+        raise NotImplementedError
+
+    def stop(self):
+        """Stop the camera."""
+        raise NotImplementedError
+
+    def capture_array(self, name: str = "main"):
+        """Capture a frame and return a copy of one stream."""
+        raise NotImplementedError
+
+    def capture_request(self):
+        """Capture a frame and return the request, which must be released."""
+        raise NotImplementedError
+
+    def capture_metadata(self):
+        """Capture a frame and return its metadata."""
+        raise NotImplementedError
+
+    def map_stream(self, request, name: str = "main"):
+        """Return a context manager giving the stream array of a request without a copy."""
+        raise NotImplementedError
+
+    def switch_mode_and_capture_array(self, config, name: str = "main"):
+        """Switch to config, capture one stream and switch back."""
+        raise NotImplementedError
+
+
+class Picamera2Backend(CameraBackend):
+    """Backend for the Raspberry Pi camera through Picamera2."""
+
+    def __init__(self):
+        """Open the camera."""
+        super().__init__()
+        # Imported here so the other backends work without picamera2 installed
+        from picamera2 import Picamera2, MappedArray # type: ignore # pylint: disable=E0401,C0415
+        from libcamera import Transform # type: ignore # pylint: disable=E0401,C0415
+        self._mapped_array = MappedArray
+        self._transform = Transform
+        self.picam2 = Picamera2()
+        self.options = self.picam2.options
+        self.sensor_resolution = self.picam2.sensor_resolution
+        self.revision = getattr(self.picam2, "revision", self.revision)
+        # Probing the modes configures the sensor, so it is done once here
+        self.sensor_modes = self.picam2.sensor_modes
+
+    def transform(self, hflip: bool = False, vflip: bool = False):
+        """Return a libcamera Transform."""
+        return self._transform(hflip=int(hflip), vflip=int(vflip))
+
+    def create_preview_configuration(self, main=None, lores=None, buffer_count=4, **kwargs):
+        """Return a preview configuration."""
+        return self.picam2.create_preview_configuration(main=main, lores=lores,
+                                                        buffer_count=buffer_count, **kwargs)
+
+    def create_still_configuration(self, main=None, lores=None, buffer_count=1, **kwargs):
+        """Return a still configuration."""
+        return self.picam2.create_still_configuration(main=main, lores=lores,
+                                                      buffer_count=buffer_count, **kwargs)
+
+    def align_configuration(self, config):
+        """Align the stream sizes of a configuration in place."""
+        self.picam2.align_configuration(config)
+
+    def configure(self, config):
+        """Configure the camera, it must be stopped."""
+        self.picam2.configure(config)
+
+    def start(self):
+        """Start the camera."""
+        self.picam2.start()
+
+    def stop(self):
+        """Stop the camera."""
+        self.picam2.stop()
+
+    def capture_array(self, name: str = "main"):
+        """Capture a frame and return a copy of one stream."""
+        return self.picam2.capture_array(name)
+
+    def capture_request(self):
+        """Capture a frame and return the request, which must be released."""
+        return self.picam2.capture_request()
+
+    def capture_metadata(self):
+        """Capture a frame and return its metadata."""
+        return self.picam2.capture_metadata()
+
+    def map_stream(self, request, name: str = "main"):
+        """Return a context manager giving the stream array of a request without a copy."""
+        return _MappedStream(self._mapped_array(request, name))
+
+    def switch_mode_and_capture_array(self, config, name: str = "main"):
+        """Switch to config, capture one stream and switch back."""
+        return self.picam2.switch_mode_and_capture_array(config, name)
+
+
+class _MappedStream:
+    """Context manager returning the array of a picamera2 MappedArray."""
+
+    def __init__(self, mapped_array):
+        """Wrap a MappedArray."""
+        self._mapped_array = mapped_array
+
+    def __enter__(self):
+        return self._mapped_array.__enter__().array
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._mapped_array.__exit__(exc_type, exc_value, traceback)
+
+
+class SimulatedRequest:
+    """A completed request holding one buffer per stream."""
+
+    def __init__(self, camera, index: int, metadata: dict):
+        """Create a request for buffer index of the camera."""
+        self._camera = camera
+        self._index = index
+        self._metadata = metadata
+        self.released = False
+
+    def make_array(self, name: str):
+        """Return a copy of the stream buffer."""
+        return self.buffer(name).copy()
+
+    def buffer(self, name: str):
+        """Return the stream buffer without copying it."""
+        if self.released:
+            raise RuntimeError("Request already released")
+        return self._camera.buffers[name][self._index]
+
+    def get_metadata(self):
+        """Return the frame metadata."""
+        return dict(self._metadata)
+
+    def release(self):
+        """Return the buffer to the camera."""
+        if not self.released:
+            self.released = True
+            self._camera.release_buffer(self._index)
+
+
+class SimulatedBackend(CameraBackend):
+    """Backend producing synthetic frames at a configurable resolution and frame rate."""
+
+    def __init__(self, sensor_resolution=(3280, 2464), frame_rate: float = 30.0,
+                 latency: float = 0.0):
+        """Create the camera.
+
+        Arguments:
+            sensor_resolution -- (width, height) of the simulated sensor
+            frame_rate -- frames per second delivered while started
+            latency -- extra seconds added to every capture call
+        """
+        super().__init__()
+        self.sensor_resolution = tuple(sensor_resolution)
+        self.frame_rate = frame_rate
+        self.latency = latency
+        self.revision = "simulated"
+        width, height = self.sensor_resolution
+        self.sensor_modes = [
+            {"size": (width // 2, height // 2), "bit_depth": 10, "fps": frame_rate * 2,
+             "crop_limits": (0, 0, width, height)},
+            {"size": (width, height), "bit_depth": 10, "fps": frame_rate,
+             "crop_limits": (0, 0, width, height)},
+        ]
+        self.camera_config = None
+        self.buffers = {}
+        self.started = False
+        self._lock = threading.Lock()
+        self._free = []
+        self._frame_index = 0
+        self._frames_since_start = 0
+        self._next_frame_time = 0.0
+
+    def _create_configuration(self, main=None, lores=None, buffer_count=4, **kwargs):
+        """Build a configuration dictionary like Picamera2 does."""
+        config = {"main": {"size": self.sensor_resolution, "format": "BGR888"},
+                  "lores": None, "raw": None, "buffer_count": buffer_count}
+        if main:
+            config["main"].update(main)
+        if lores:
+            config["lores"] = {"format": "YUV420"}
+            config["lores"].update(lores)
+        config.update(kwargs)
+        return config
+
+    def create_preview_configuration(self, main=None, lores=None, buffer_count=4, **kwargs):
+        """Return a preview configuration."""
+        return self._create_configuration(main, lores, buffer_count, **kwargs)
+
+    def create_still_configuration(self, main=None, lores=None, buffer_count=1, **kwargs):
+        """Return a still configuration."""
+        return self._create_configuration(main, lores, buffer_count, **kwargs)
+
+    def align_configuration(self, config):
+        """Round stream sizes down to even dimensions."""
+        for name in ("main", "lores"):
+            if config.get(name):
+                width, height = config[name]["size"]
+                config[name]["size"] = (width - width % 2, height - height % 2)
+
+    def configure(self, config):
+        """Allocate the buffer pool for a configuration."""
+        if self.started:
+            raise RuntimeError("Camera must be stopped before configuring")
+        count = max(1, config.get("buffer_count", 1))
+        self.buffers = {}
+        for name in ("main", "lores"):
+            if not config.get(name):
+                continue
+            width, height = config[name]["size"]
+            if config[name]["format"] == "YUV420":
+                shape = (count, height * 3 // 2, width)
+            else:
+                shape = (count, height, width, 3)
+            self.buffers[name] = np.zeros(shape, dtype=np.uint8)
+        self._free = list(range(count))
+        self.camera_config = config
+
+    def start(self):
+        """Start delivering frames."""
+        if self.camera_config is None:
+            raise RuntimeError("Camera must be configured before starting")
+        self.started = True
+        self._frames_since_start = 0
+        self._next_frame_time = time.monotonic()
+
+    def stop(self):
+        """Stop delivering frames."""
+        self.started = False
+
+    def release_buffer(self, index: int):
+        """Return a buffer to the free pool."""
+        with self._lock:
+            self._free.append(index)
+
+    def capture_request(self):
+        """Wait for the next frame and return it as a request."""
+        if not self.started:
+            raise RuntimeError("Camera not started")
+        if self.latency:
+            time.sleep(self.latency)
+        # Frames arrive at the configured frame rate
+        now = time.monotonic()
+        if self._next_frame_time > now:
+            time.sleep(self._next_frame_time - now)
+        self._next_frame_time = max(now, self._next_frame_time) + 1.0 / self.frame_rate
+
+        with self._lock:
+            if not self._free:
+                raise RuntimeError("No free camera buffers, requests were not released")
+            index = self._free.pop(0)
+            self._frame_index += 1
+            self._frames_since_start += 1
+            frame_index = self._frame_index
+            frames_since_start = self._frames_since_start
+        for stream in self.buffers.values():
+            # Cheap synthetic content: a bar moving down the frame
+            stream[index].fill(64)
+            row = frame_index % stream.shape[1]
+            stream[index, row:row + 8] = 255
+        # AE/AWB converge over the first frames after the sensor starts
+        convergence = 1.0 - 0.5 ** min(frames_since_start, 30)
+        metadata = {
+            "SensorTimestamp": time.monotonic_ns(),
+            "FrameDuration": int(1e6 / self.frame_rate),
+            "ExposureTime": int(20000 * convergence),
+            "AnalogueGain": 1.0 + 3.0 * convergence,
+            "ColourGains": (1.2 + 0.8 * convergence, 1.1 + 0.6 * convergence),
+        }
+        return SimulatedRequest(self, index, metadata)
+
+    def capture_array(self, name: str = "main"):
+        """Capture a frame and return a copy of one stream."""
+        request = self.capture_request()
+        try:
+            return request.make_array(name)
+        finally:
+            request.release()
+
+    def capture_metadata(self):
+        """Capture a frame and return its metadata."""
+        request = self.capture_request()
+        try:
+            return request.get_metadata()
+        finally:
+            request.release()
+
+    def map_stream(self, request, name: str = "main"):
+        """Return the stream buffer of a request without copying it."""
+        return contextlib.nullcontext(request.buffer(name))
+
+    def switch_mode_and_capture_array(self, config, name: str = "main"):
+        """Switch to config, capture one stream and switch back."""
+        previous = self.camera_config
+        self.stop()
+        self.configure(config)
+        self.start()
+        try:
+            return self.capture_array(name)
+        finally:
+            self.stop()
+            self.configure(previous)
+            self.start()
+
+
+def create_backend(name: str = BACKEND_PICAMERA2, **kwargs):
+    """Create a camera backend by name, kwargs are passed to SimulatedBackend."""
+    if name == BACKEND_SIMULATED:
+        return SimulatedBackend(**kwargs)
+    if name == BACKEND_PICAMERA2:
+        return Picamera2Backend()
+    raise ValueError(f"Unknown camera backend '{name}'")
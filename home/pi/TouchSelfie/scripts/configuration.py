@@ -13,6 +13,7 @@ class Configuration():
     archive      = True # Do we archive photos locally
     archive_dir  = os.path.join("..","Photos") # Where do we archive photos
     archive_to_all_usb_drives  = True
+    archive_individual_shots = False # Also archive every shot of a collage or animation
     album_id      = None #  use install_credentials.py to create 'album.id'
     album_name   = "Drop Box"
     email_subject = "Here's your photo!" # subject line of the email sent from the photobooth
@@ -37,6 +38,12 @@ class Configuration():
     image_keywords = "TouchSelfie, Raspberry Pi, Photobooth"
     location_lat = ""
     location_long = ""
+    # GPS location from gpsd, location_lat/location_long are the static coordinates
+    gps_enabled = False # Read the location from gpsd
+    gps_host = "127.0.0.1"
+    gps_port = 2947
+    gps_max_fix_age = 60 # seconds after which a GPS fix is stale
+    gps_fallback_to_static = True # Use the static coordinates without a fresh fix
 
     #init
     def __init__(self,configuration_file_name):
@@ -94,6 +101,8 @@ class Configuration():
             self.archive = config["local_archive"]
         if "archive_to_all_usb_drives" in list(config.keys()):
             self.archive_to_all_usb_drives = config["archive_to_all_usb_drives"]
+        if "archive_individual_shots" in list(config.keys()):
+            self.archive_individual_shots = config["archive_individual_shots"]
         if "local_archive_dir" in list(config.keys()):
             self.archive_dir = config["local_archive_dir"]
         if "google_photo_album_id" in list(config.keys()):
@@ -145,6 +154,16 @@ class Configuration():
             self.location_lat = config["location_lat"]
         if "location_long" in list(config.keys()):
             self.location_long = config["location_long"]
+        if "gps_enabled" in list(config.keys()):
+            self.gps_enabled = config["gps_enabled"]
+        if "gps_host" in list(config.keys()):
+            self.gps_host = config["gps_host"]
+        if "gps_port" in list(config.keys()):
+            self.gps_port = config["gps_port"]
+        if "gps_max_fix_age" in list(config.keys()):
+            self.gps_max_fix_age = config["gps_max_fix_age"]
+        if "gps_fallback_to_static" in list(config.keys()):
+            self.gps_fallback_to_static = config["gps_fallback_to_static"]
 
         return self.is_valid
 
@@ -158,6 +177,7 @@ class Configuration():
             "snap_caption": self.photo_caption,
             "local_archive" : self.archive,
             "archive_to_all_usb_drives" : self.archive_to_all_usb_drives,
+            "archive_individual_shots" : self.archive_individual_shots,
             "local_archive_dir" : self.archive_dir,
             "google_photo_album_id" : self.album_id,
             "google_photo_album_name" : self.album_name,
@@ -182,7 +202,12 @@ class Configuration():
             "software": self.software,
             "imageKeyWords": self.image_keywords,
             "location_lat": self.location_lat,
-            "location_long": self.location_long
+            "location_long": self.location_long,
+            "gps_enabled": self.gps_enabled,
+            "gps_host": self.gps_host,
+            "gps_port": self.gps_port,
+            "gps_max_fix_age": self.gps_max_fix_age,
+            "gps_fallback_to_static": self.gps_fallback_to_static
         }
         try:
             with open(self.config_file,'w', encoding='utf-8') as config:
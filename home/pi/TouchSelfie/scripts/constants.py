@@ -17,16 +17,79 @@ LOG_FORMAT = "%(asctime)s \t " + \
     "%(levelname)s \t " + \
     "%(message)s"  # Log format
 TEMP_FOLDER = "../Temp"  # Temporary folder for storing files
+# RAM backed (tmpfs) folder for the working files of photo sessions, "" to use
+# TEMP_FOLDER only. Sessions fall back to TEMP_FOLDER when the session files in
+# RAM would exceed WORKING_STORAGE_BUDGET_MB or leave less than
+# WORKING_STORAGE_MIN_FREE_MB of memory available
+WORKING_STORAGE_FOLDER = "/dev/shm/TouchSelfie"
+WORKING_STORAGE_BUDGET_MB = 256
+WORKING_STORAGE_MIN_FREE_MB = 128
 ARCHIVE_FOLDER = "../Photos"  # Folder for storing photos
 LOGO_FOLDER = "../logos"  # Folder for storing frames and logos
 
+#### Camera Constants ####
+# Camera backend: "picamera2" for the Raspberry Pi camera or "simulated" for
+# synthetic frames (benchmarking and testing without a camera)
+CAMERA_BACKEND = "picamera2"
+# Camera strategy used by BoothCamera
+# "switch_mode": separate preview and still configurations, the sensor is
+#                reconfigured for every still (original behaviour)
+# "dual_stream": one still configuration with a full resolution main stream and
+#                a lores preview stream, no mode switch between preview and stills.
+#                Opt-in: keeps full resolution buffers allocated, check the CMA and
+#                RAM headroom of the Pi before enabling it
+CAMERA_STRATEGY = "switch_mode"
+# Zero shutter lag: number of full resolution frames kept while the preview runs
+# (dual_stream only, 0 disables) and the memory they may use in MB. Opt-in, e.g. 4,
+# each frame is a full resolution buffer
+PRE_CAPTURE_DEPTH = 0
+PRE_CAPTURE_MEMORY_MB = 128
+# Camera warm-up: ready once exposure, gain and colour gains change by less than
+# CAMERA_READY_TOLERANCE (relative) for CAMERA_READY_STABLE_FRAMES frames in a row,
+# or after CAMERA_READY_TIMEOUT seconds
+CAMERA_READY_TIMEOUT = 2.0
+CAMERA_READY_STABLE_FRAMES = 3
+CAMERA_READY_TOLERANCE = 0.02
+# Keep the camera running between sessions and recycle its request buffers
+# instead of stopping it after every capture (opt-in with True)
+CAMERA_KEEP_RUNNING = False
+# Background JPEG encoding of captured stills: number of encoder threads and
+# number of captured images that may wait to be encoded
+ENCODER_WORKERS = 2
+ENCODER_MAX_PENDING = 4
+# Measure the still capture latency of both strategies when the camera starts
+CAMERA_MEASURE_LATENCY = False
+# Number of photo sessions that may be in flight at once. With more than one, a
+# session's photos are assembled, archived and uploaded in the background while
+# the next guest starts a session; 1 runs the sessions one after the other.
+# Opt-in with 2, the photos of two sessions are then in memory at once
+SESSIONS_IN_FLIGHT = 1
+# Animated GIFs only update the pixels whose colour moved by more than this RGB
+# distance between frames, so sensor noise does not rewrite every pixel
+GIF_DELTA_TOLERANCE = 8
+# Largest size of the animated GIF frames
+GIF_FRAME_SIZE = (800, 600)
+
 #### UI Constants ####
+# Time the assembled photo is shown before it is uploaded, in milliseconds
+REVIEW_HOLD_MILLIS = 3000
+# Size of the collage shown for review, built from shrunk shots as they are taken
+REVIEW_SIZE = (800, 480)
+# Collage layouts, see booth_layouts.py. The number of photos of a layout must
+# match the photo_count of the button it is attached to
+LAYOUT_SINGLE = {"type": "grid", "columns": 1, "rows": 1}
+LAYOUT_FOUR_SQUARE = {"type": "grid", "columns": 2, "rows": 2}
+LAYOUT_NINE_SQUARE = {"type": "grid", "columns": 3, "rows": 3}
+LAYOUT_TWO_BY_THREE = {"type": "grid", "columns": 2, "rows": 3}  # 6 photos
+LAYOUT_STRIP = {"type": "strip", "spacing": 40, "margin": 40}  # Any number of photos
+LAYOUT_HERO = {"type": "hero", "spacing": 40, "margin": 40}  # Any number of photos
 # Buttons configuration
 BUTTON_PHOTO_ONE = {
     "name": "Single Photo",  # Name of the button
     "location": "bottom",  # Location of the button on the screen
     "icon": os.path.join(RESOURCES_FOLDER, "ic_portrait.png"), # Path to the button icon
     "photo_size": (3280, 2464),  # Size for a single photo
+    "layout": LAYOUT_SINGLE,  # Placement of the photos in the collage
     "foreground_image": os.path.join(LOGO_FOLDER, 
                                      "single_logo.png"), 
                                      # Overlay image on top of the collage
@@ -37,6 +100,7 @@ BUTTON_PHOTO_FOUR = {
     "icon": os.path.join(RESOURCES_FOLDER, "ic_four.png"), # Path to the button icon
     "photo_size": (1640, 1232),  # Size for a single photo
     "photo_count": 4,  # Number of photos to take
+    "layout": LAYOUT_FOUR_SQUARE,  # Placement of the photos in the collage
     "foreground_image": os.path.join(LOGO_FOLDER, 
                                      "collage_four_square_logo.png"), 
                                      # Overlay image on top of the collage
@@ -47,6 +111,7 @@ BUTTON_PHOTO_NINE = {
     "icon": os.path.join(RESOURCES_FOLDER, "ic_nine.png"), # Path to the button icon
     "photo_size": (1093, 821),  # Size for a single photo
     "photo_count": 9,  # Number of photos to take
+    "layout": LAYOUT_NINE_SQUARE,  # Placement of the photos in the collage
     "foreground_image": os.path.join(LOGO_FOLDER, 
                                      "collage_nine_square_logo.png"), 
                                      # Overlay image on top of the collage
@@ -59,6 +124,7 @@ BUTTON_PHOTO_ANIMATION = {
     "photo_count": 10,  # Number of photos to take
     "foreground_image": "", # Overlay image on top of the collage
     "snap_period_millis": 200,  # Time between two snaps in milliseconds
+    "burst": True,  # Capture all frames from the running stream on the sensor clock
     'gif_period_millis' : 500    # time interval in the animated gif
 }
 BUTTON_PRINT_PHOTO = {
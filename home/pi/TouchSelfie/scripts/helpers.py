@@ -1,7 +0,0 @@
-"""Module containing helper functions for the project."""
-
-import time
-
-def millis():
-    """Get the current time in milliseconds"""
-    return int(time.time() * 1000)